@@ -5,130 +5,262 @@ import numpy as np
 import loggers as lg
 
 
-class Node():
+NODE_CHUNK = 1024
+EDGE_CHUNK = 8192
 
-    def __init__(self, state):
 
-        self.state = state
-        self.playerTurn = state.playerTurn
-        self.id = state.id
-        self.edges = []
-
-    def isLeaf(self):
-        if self.edges:
-            return False
-        return True
-
-
-class Edge():
-
-    def __init__(self, inNode, outNode, prior, action):
-        self.id = inNode.state.id + '|' + outNode.state.id
-        self.inNode = inNode
-        self.outNode = outNode
-        self.playerTurn = inNode.state.playerTurn
-        self.action = action
+class MCTS():
+    """
+    Search tree stored as flat arrays.
 
-        self.stats = {
-            'N': 0,
-            'W': 0,
-            'Q': 0,
-            'P': prior,
-        }
+    Nodes are integer indices into the node pool. The children of a node
+    occupy the contiguous edge slots [childStart, childStart + childCount)
+    of the edge arrays N, W, Q, P, action and child. Both pools grow in
+    chunks so expanding a leaf does not allocate any Python objects.
 
+    Expanding a leaf only records each edge's action and prior; its child
+    is -1 until a descent first takes that edge, and only then is the
+    child state built with takeAction.
 
-class MCTS():
+    rng supplies the Dirichlet noise and the tie-breaks during selection;
+    pass a seeded np.random.RandomState for a reproducible search.
+    """
 
-    def __init__(self, root, cpuct):
-        self.root = root
+    def __init__(self, root, cpuct, rng=np.random):
         self.tree = {}
         self.cpuct = cpuct
-        self.addNode(root)
+        self.rng = rng
+
+        self.states = []
+        self.nodePlayer = np.zeros(NODE_CHUNK, dtype=np.int8)
+        self.nodeValue = np.zeros(NODE_CHUNK, dtype=np.float32)
+        self.nodeDone = np.zeros(NODE_CHUNK, dtype=np.int8)
+        self.childStart = np.zeros(NODE_CHUNK, dtype=np.int64)
+        self.childCount = np.zeros(NODE_CHUNK, dtype=np.int32)
+        self.numNodes = 0
+
+        self.N = np.zeros(EDGE_CHUNK, dtype=np.int32)
+        self.W = np.zeros(EDGE_CHUNK, dtype=np.float64)
+        self.Q = np.zeros(EDGE_CHUNK, dtype=np.float64)
+        self.P = np.zeros(EDGE_CHUNK, dtype=np.float64)
+        self.action = np.zeros(EDGE_CHUNK, dtype=np.int32)
+        self.child = np.zeros(EDGE_CHUNK, dtype=np.int64)
+        self.edgePlayer = np.zeros(EDGE_CHUNK, dtype=np.int8)
+        self.numEdges = 0
+
+        self.root = self.addNode(root)
 
     def __len__(self):
-        return len(self.tree)
-
-    def moveToLeaf(self):
-
-        lg.logger_mcts.info('------MOVING TO LEAF------')
+        return self.numNodes
+
+    def isLeaf(self, node):
+        return self.childCount[node] == 0
+
+    def children(self, node):
+        start = self.childStart[node]
+        return slice(start, start + self.childCount[node])
+
+    def edgeRange(self, nodes):
+        """ The edge slots of all of nodes' children, concatenated """
+        counts = self.childCount[nodes]
+        offsets = np.cumsum(counts) - counts
+        return np.repeat(self.childStart[nodes] - offsets, counts) + np.arange(counts.sum())
+
+    def reachable(self, node):
+        """ The nodes reachable from node, in breadth-first order starting with node """
+        seen = np.zeros(self.numNodes, dtype=bool)
+        seen[node] = True
+        order = [np.array([node])]
+        frontier = order[0]
+        while len(frontier):
+            children = self.child[self.edgeRange(frontier)]
+            children = children[children >= 0]
+            frontier = np.unique(children[~seen[children]])
+            seen[frontier] = True
+            order.append(frontier)
+        return np.concatenate(order)
+
+    def reroot(self, node):
+        """
+        Make node the root and compact both pools down to the subtree under it.
+
+        Sibling subtrees that can no longer be reached are dropped; the kept
+        nodes and their edges (with their N, W, Q and P) are copied to the
+        front of freshly sized pools, with the new root at index 0.
+        Returns the number of nodes retained and freed.
+        """
+        kept = self.reachable(node)
+        freed = self.numNodes - len(kept)
+
+        newIndex = np.full(self.numNodes, -1, dtype=np.int64)
+        newIndex[kept] = np.arange(len(kept))
+        edges = self.edgeRange(kept)
+        counts = self.childCount[kept]
+
+        nodeSize = -(-len(kept) // NODE_CHUNK) * NODE_CHUNK
+        edgeSize = max(EDGE_CHUNK, -(-len(edges) // EDGE_CHUNK) * EDGE_CHUNK)
+        for name in ('nodePlayer', 'nodeValue', 'nodeDone', 'childCount'):
+            old = getattr(self, name)
+            new = np.zeros(nodeSize, dtype=old.dtype)
+            new[:len(kept)] = old[kept]
+            setattr(self, name, new)
+        self.childStart = np.zeros(nodeSize, dtype=np.int64)
+        self.childStart[:len(kept)] = np.cumsum(counts) - counts
+
+        for name in ('N', 'W', 'Q', 'P', 'action', 'child', 'edgePlayer'):
+            old = getattr(self, name)
+            new = np.zeros(edgeSize, dtype=old.dtype)
+            new[:len(edges)] = old[edges]
+            setattr(self, name, new)
+        child = self.child[:len(edges)]
+        child[child >= 0] = newIndex[child[child >= 0]]
+
+        self.states = [self.states[idx] for idx in kept]
+        self.tree = {state.id: idx for idx, state in enumerate(self.states)}
+        self.numNodes = len(kept)
+        self.numEdges = len(edges)
+        self.root = 0
+        return self.numNodes, freed
+
+    def _growNodes(self):
+        size = len(self.nodePlayer) + NODE_CHUNK
+        for name in ('nodePlayer', 'nodeValue', 'nodeDone', 'childStart', 'childCount'):
+            setattr(self, name, np.resize(getattr(self, name), size))
+
+    def _growEdges(self, needed):
+        size = len(self.N) + max(EDGE_CHUNK, needed)
+        for name in ('N', 'W', 'Q', 'P', 'action', 'child', 'edgePlayer'):
+            old = getattr(self, name)
+            new = np.zeros(size, dtype=old.dtype)
+            new[:self.numEdges] = old[:self.numEdges]
+            setattr(self, name, new)
+
+    def addNode(self, state, value=0, done=0):
+        if self.numNodes == len(self.nodePlayer):
+            self._growNodes()
+        node = self.numNodes
+        self.numNodes += 1
+
+        self.states.append(state)
+        self.nodePlayer[node] = state.playerTurn
+        self.nodeValue[node] = value
+        self.nodeDone[node] = done
+        self.childStart[node] = 0
+        self.childCount[node] = 0
+        self.tree[state.id] = node
+        return node
+
+    def expand(self, node, actions, priors):
+        count = len(actions)
+        if self.numEdges + count > len(self.N):
+            self._growEdges(count)
+        start = self.numEdges
+        end = start + count
+        self.numEdges = end
+
+        self.N[start:end] = 0
+        self.W[start:end] = 0
+        self.Q[start:end] = 0
+        self.P[start:end] = priors
+        self.action[start:end] = actions
+        self.child[start:end] = -1
+        self.edgePlayer[start:end] = self.nodePlayer[node]
+
+        self.childStart[node] = start
+        self.childCount[node] = count
+
+    def addChild(self, node, edge):
+        """ Build the state at the end of edge and link it, reusing the node of a transposition """
+        newState, newValue, newDone = self.states[node].takeAction(int(self.action[edge]))
+        if newState.id not in self.tree:
+            self.child[edge] = self.addNode(newState, newValue, newDone)
+            if lg.tracing(lg.logger_mcts):
+                lg.logger_mcts.info('added node...%s...p = %f', newState.id, self.P[edge])
+        else:
+            self.child[edge] = self.tree[newState.id]
+            if lg.tracing(lg.logger_mcts):
+                lg.logger_mcts.info('existing node...%s...', newState.id)
+
+    def moveToLeaf(self, virtualLoss=0):
+        trace = lg.tracing(lg.logger_mcts)
+        if trace:
+            lg.logger_mcts.info('------MOVING TO LEAF------')
         breadcrumbs = []
         currentNode = self.root
 
-        done = 0
-        value = 0
+        while not self.isLeaf(currentNode):
 
-        while not currentNode.isLeaf():
+            if trace:
+                lg.logger_mcts.info('PLAYER TURN...%d', self.nodePlayer[currentNode])
 
-            lg.logger_mcts.info('PLAYER TURN...%d', currentNode.state.playerTurn)
-
-            maxQU = -99999
+            edges = self.children(currentNode)
+            N = self.N[edges]
+            P = self.P[edges]
 
             if currentNode == self.root:
                 epsilon = config.EPSILON
-                nu = np.random.dirichlet([config.ALPHA] * len(currentNode.edges))
-            else:
-                epsilon = 0
-                nu = [0] * len(currentNode.edges)
-
-            Nb = 0
-            for action, edge in currentNode.edges:
-                Nb = Nb + edge.stats['N']
-
-            for idx, (action, edge) in enumerate(currentNode.edges):
-
-                U = self.cpuct * \
-                    ((1-epsilon) * edge.stats['P'] + epsilon * nu[idx]) *\
-                    np.sqrt(Nb) / (1 + edge.stats['N'])
-
-                Q = edge.stats['Q']
-
-                lg.logger_mcts.info('action: %d (%d)... N = %d, P = %f, nu = %f, adjP = %f, W = %f, Q = %f, U = %f, Q+U = %f',
-                                    action,
-                                    action % 7,
-                                    edge.stats['N'],
-                                    np.round(edge.stats['P'], 6),
-                                    np.round(nu[idx], 6),
-                                    ((1-epsilon) * edge.stats['P'] + epsilon * nu[idx]),
-                                    np.round(edge.stats['W'], 6),
-                                    np.round(Q, 6),
-                                    np.round(U, 6),
-                                    np.round(Q+U, 6))
-                if Q + U > maxQU:
-                    maxQU = Q + U
-                    simulationAction = action
-                    simulationEdge = edge
-            lg.logger_mcts.info('action with highest Q + U...%d', simulationAction)
-            newState, value, done = currentNode.state.takeAction(simulationAction)  #the value of the newState from the POV of the new playerTurn
-            currentNode = simulationEdge.outNode
-            breadcrumbs.append(simulationEdge)
-
-        lg.logger_mcts.info('DONE...%d', done)
+                nu = self.rng.dirichlet(np.full(len(P), config.ALPHA))
+                P = (1-epsilon) * P + epsilon * nu
 
-        return currentNode, value, done, breadcrumbs
+            U = self.cpuct * P * np.sqrt(N.sum()) / (1 + N)
+            QU = self.Q[edges] + U
 
-    def backFill(self, leaf, value, breadcrumbs):
-        lg.logger_mcts.info('------DOING BACKFILL------')
-        currentPlayer = leaf.state.playerTurn
-        for edge in breadcrumbs:
-            playerTurn = edge.playerTurn
-            if playerTurn == currentPlayer:
-                direction = 1
+            # break ties at random so that repeated visits to an unexplored
+            # node do not always favour the lowest action index
+            best = np.flatnonzero(QU == QU.max())
+            if len(best) > 1:
+                best = self.rng.choice(best)
             else:
-                direction = -1
+                best = best[0]
+            simulationEdge = edges.start + best
+
+            if trace:
+                lg.logger_mcts.info('actions: %s, N = %s, adjP = %s, Q = %s, U = %s',
+                                    self.action[edges], N, P, self.Q[edges], U)
+                lg.logger_mcts.info('action with highest Q + U...%d', self.action[simulationEdge])
+            if self.child[simulationEdge] < 0:
+                self.addChild(currentNode, simulationEdge)
+            currentNode = self.child[simulationEdge]
+            breadcrumbs.append(simulationEdge)
 
-            edge.stats['N'] = edge.stats['N'] + 1
-            edge.stats['W'] = edge.stats['W'] + value * direction
-            edge.stats['Q'] = edge.stats['W'] / edge.stats['N']
+            if virtualLoss:
+                # count the pending visit as a loss until backFill resolves it
+                self.N[simulationEdge] += virtualLoss
+                self.W[simulationEdge] -= virtualLoss
+                self.Q[simulationEdge] = self.W[simulationEdge] / self.N[simulationEdge]
 
-            lg.logger_mcts.info('updating edge with value %f for player %d... N = %d, W = %f, Q = %f'
-                , value * direction
-                , playerTurn
-                , edge.stats['N']
-                , edge.stats['W']
-                , edge.stats['Q']
-                )
+        # the value of the leaf state from the POV of its playerTurn
+        value = self.nodeValue[currentNode]
+        done = self.nodeDone[currentNode]
 
-            edge.outNode.state.render(lg.logger_mcts)
+        if trace:
+            lg.logger_mcts.info('DONE...%d', done)
+
+        return currentNode, value, done, breadcrumbs
 
-    def addNode(self, node):
-        self.tree[node.id] = node
+    def backFill(self, leaf, value, breadcrumbs, virtualLoss=0):
+        trace = lg.tracing(lg.logger_mcts)
+        if trace:
+            lg.logger_mcts.info('------DOING BACKFILL------')
+        if not breadcrumbs:
+            return
+
+        currentPlayer = self.nodePlayer[leaf]
+        edges = np.array(breadcrumbs)
+        direction = np.where(self.edgePlayer[edges] == currentPlayer, 1, -1)
+
+        self.N[edges] += 1 - virtualLoss
+        self.W[edges] += value * direction + virtualLoss
+        self.Q[edges] = self.W[edges] / self.N[edges]
+
+        if trace:
+            for edge, sign in zip(breadcrumbs, direction):
+                lg.logger_mcts.info('updating edge with value %f for player %d... N = %d, W = %f, Q = %f'
+                    , value * sign
+                    , self.edgePlayer[edge]
+                    , self.N[edge]
+                    , self.W[edge]
+                    , self.Q[edge]
+                    )
+
+                self.states[self.child[edge]].render(lg.logger_mcts)
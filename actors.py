@@ -0,0 +1,160 @@
+import multiprocessing as mp
+import random
+import time
+
+import numpy as np
+
+import config
+from checkpoint import flatten, unflatten
+
+
+class WeightBroadcast():
+    """
+    The best network's weights as one flat float32 block of shared memory.
+
+    The learner publishes a new version after every promotion; actors copy
+    the block out and reshape it to their own model's weight shapes, so the
+    Keras model itself is never pickled. The block is a RawArray of size
+    floats, so it has to be created before the actors are forked.
+    """
+
+    def __init__(self, ctx, size):
+        self.lock = ctx.Lock()
+        self.version = ctx.Value('i', 0, lock=False)
+        self.weights = ctx.RawArray('f', size)
+
+    def publish(self, weights):
+        flat = flatten(weights)
+        if flat.size != len(self.weights):
+            raise ValueError('%d weights published to a broadcast of %d' % (flat.size, len(self.weights)))
+        with self.lock:
+            np.frombuffer(self.weights, dtype=np.float32)[:] = flat
+            self.version.value += 1
+
+    def read(self, shapes):
+        with self.lock:
+            flat = np.frombuffer(self.weights, dtype=np.float32).copy()
+            version = self.version.value
+
+        return version, unflatten(flat, shapes)
+
+
+def weightCount(input_dim, output_dim, hidden_layers, folded):
+    """
+    The number of floats the learner publishes: NumpyModel's folded weights,
+    or Residual_CNN's, where each batch norm holds four arrays (gamma, beta,
+    mean and variance) in place of the folded bias.
+    """
+    from numpy_model import layout
+
+    count = 0
+    for name, shape in layout(input_dim, output_dim, hidden_layers):
+        size = int(np.prod(shape))
+        count += size if folded or not name.endswith('_bias') else 4 * size
+    return count
+
+
+def packGames(rows, model):
+    """ Turn finished memory rows into a few arrays that are cheap to send between processes """
+    return {'input': model.convertBatchToModelInput([row['state'] for row in rows]),
+            'AV': np.array([row['AV'] for row in rows], dtype=np.float32),
+            'value': np.array([row['value'] for row in rows], dtype=np.float32),
+            'playerTurn': np.array([row['playerTurn'] for row in rows], dtype=np.int8),
+            'id': [row['id'] for row in rows]}
+
+
+def runActor(broadcast, results):
+    import loggers as lg
+    from agent import Agent
+    from funcs import playMatchesConcurrently
+    from game import Game
+    from memory import Memory
+
+    # forked actors start with the learner's random state
+    np.random.seed()
+    random.seed()
+
+    env = Game()
+    if config.NUMPY_INFERENCE:
+        from numpy_model import NumpyModel, QuantizedModel, memoryInputs, randomInputs
+        if config.INFERENCE_QUANTIZATION:
+            best_NN = QuantizedModel((15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS, config.INFERENCE_QUANTIZATION)
+        else:
+            best_NN = NumpyModel((15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS)
+        shapes = best_NN.shapes
+    else:
+        from model import inference_model
+        best_NN = inference_model((15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS)
+        shapes = [w.shape for w in best_NN.model.get_weights()]
+    best_player = Agent('best_player', env.state_size, env.action_size, config.MCTS_SIMS, config.CPUCT, best_NN)
+    memory = Memory(config.MEMORY_SIZE)
+    games = max(1, config.CONCURRENT_GAMES)
+
+    calibrated = config.NUMPY_INFERENCE and config.INFERENCE_QUANTIZATION == 'int8'
+    # until there are self-play positions, calibrate on random games
+    calibration = randomInputs(env, best_NN) if calibrated else None
+    version = 0
+    while True:
+        if broadcast.version.value != version:
+            version, weights = broadcast.read(shapes)
+            best_NN.set_weights(weights)
+            if calibrated:
+                best_NN.calibrate(calibration)
+        if version == 0:
+            time.sleep(0.1)
+            continue
+
+        playMatchesConcurrently(best_player, best_player, games, lg.logger_main, turns_until_tau0 = config.TURNS_UNTIL_TAU0, memory = memory, games = games)
+        memory.clear_stmemory()
+
+        if calibrated and memory.ltmemory:
+            # positions for calibrating the next weights version
+            calibration = memoryInputs(memory.ltmemory, best_NN)
+        results.put((games, packGames(memory.ltmemory, best_NN)))
+        memory.ltmemory.clear()
+
+
+class ActorPool():
+    """
+    Self-play in separate processes, each with its own Agent and network.
+
+    Create the pool before the learner imports Keras: the actors are forked
+    and must start without TensorFlow. With NUMPY_INFERENCE the pool first
+    checks NumpyModel against the committed Keras outputs (see
+    numpy_model.checkParity) and refuses to start if they disagree.
+    """
+
+    def __init__(self, n_actors):
+        from game import Game
+
+        if config.NUMPY_INFERENCE:
+            from numpy_model import checkParity
+            checkParity()
+        env = Game()
+        ctx = mp.get_context('fork')
+        self.broadcast = WeightBroadcast(ctx, weightCount((15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS, config.NUMPY_INFERENCE))
+        self.results = ctx.Queue(maxsize=2 * n_actors)
+        self.processes = [ctx.Process(target=runActor, args=(self.broadcast, self.results), daemon=True) for _ in range(n_actors)]
+        for p in self.processes:
+            p.start()
+
+    def publish(self, nn):
+        """ Send the actors a Residual_CNN's weights, folded for NumpyModel if they use it """
+        if config.NUMPY_INFERENCE:
+            from numpy_model import NumpyModel
+            self.broadcast.publish(NumpyModel.fromKeras(nn).get_weights())
+        else:
+            self.broadcast.publish(nn.model.get_weights())
+
+    def collect(self, memory, episodes):
+        played = 0
+        while played < episodes:
+            games, arrays = self.results.get()
+            memory.commit_arrays(arrays)
+            played += games
+            print('episode: ' + str(played) + ' ', end='')
+
+    def close(self):
+        for p in self.processes:
+            p.terminate()
+            p.join()
@@ -10,6 +10,7 @@ import pylab as pl
 import config
 import loggers as lg
 import MCTS as mc
+from cache import EvalCache
 
 
 class User():
@@ -32,7 +33,7 @@ class User():
 
 class Agent():
 
-    def __init__(self, name, state_size, action_size, mcts_simulations, cpuct, model):
+    def __init__(self, name, state_size, action_size, mcts_simulations, cpuct, model, leaf_batch=config.MCTS_BATCH_SIZE, symmetries=None):
         self.name = name
 
         self.state_size = state_size
@@ -41,7 +42,11 @@ class Agent():
         self.cpuct = cpuct
 
         self.MCTSsimulations = mcts_simulations
+        self.leafBatch = leaf_batch
         self.model = model
+        # a game's symmetries table to average the network over them, or None
+        self.symmetries = symmetries
+        self.cache = EvalCache(config.EVAL_CACHE_SIZE)
 
         self.mcts = None
 
@@ -53,13 +58,17 @@ class Agent():
         self.val_policy_loss = []
 
     def simulate(self):
-        lg.logger_mcts.info('ROOT NODE...%s', self.mcts.root.state.id)
-        self.mcts.root.state.render(lg.logger_mcts)
-        lg.logger_mcts.info('CURRENT PLAYER...%d', self.mcts.root.state.playerTurn)
+        trace = lg.tracing(lg.logger_mcts)
+        if trace:
+            root = self.mcts.states[self.mcts.root]
+            lg.logger_mcts.info('ROOT NODE...%s', root.id)
+            root.render(lg.logger_mcts)
+            lg.logger_mcts.info('CURRENT PLAYER...%d', root.playerTurn)
 
         # #### MOVE THE LEAF NODE
         leaf, value, done, breadcrumbs = self.mcts.moveToLeaf()
-        leaf.state.render(lg.logger_mcts)
+        if trace:
+            self.mcts.states[leaf].render(lg.logger_mcts)
 
         # #### EVALUATE THE LEAF NODE
         value, breadcrumbs = self.evaluateLeaf(leaf, value, done, breadcrumbs)
@@ -67,6 +76,40 @@ class Agent():
         # #### BACKFILL THE VALUE THROUGH THE TREE
         self.mcts.backFill(leaf, value, breadcrumbs)
 
+    def simulateBatch(self, size):
+        """
+        Run up to size simulations, evaluating all of their leaves with a
+        single model call. Virtual loss steers the descents apart; a descent
+        that still lands on a leaf already in this batch ends the round early.
+        Returns the number of simulations run.
+        """
+        virtualLoss = config.VIRTUAL_LOSS
+        paths = []
+        pending = {}
+        for _ in range(size):
+            leaf, value, done, breadcrumbs = self.mcts.moveToLeaf(virtualLoss)
+            paths.append((leaf, value, done, breadcrumbs))
+            if leaf in pending:
+                break
+            if done == 0:
+                pending[leaf] = None
+
+        leaves = list(pending)
+        preds = self.get_preds_batch([self.mcts.states[leaf] for leaf in leaves])
+        trace = lg.tracing(lg.logger_mcts)
+        for leaf, (value, probs, allowedActions) in zip(leaves, preds):
+            if trace:
+                lg.logger_mcts.info('PREDICTED VALUE FOR %d: %f', self.mcts.nodePlayer[leaf], value)
+            self.expandLeaf(leaf, probs, allowedActions)
+            pending[leaf] = value
+
+        for leaf, value, done, breadcrumbs in paths:
+            if done == 0:
+                value = pending[leaf]
+            self.mcts.backFill(leaf, value, breadcrumbs, virtualLoss)
+
+        return len(paths)
+
     def act(self, state, tau):
 
         if self.mcts == None or state.id not in self.mcts.tree:
@@ -75,11 +118,18 @@ class Agent():
             self.changeRootMCTS(state)
 
         # ### run the simulation
-        for sim in range(self.MCTSsimulations):
-            lg.logger_mcts.info('***************************')
-            lg.logger_mcts.info('****** SIMULATION %d ******', sim + 1)
-            lg.logger_mcts.info('***************************')
-            self.simulate()
+        if self.leafBatch > 1:
+            sim = 0
+            while sim < self.MCTSsimulations:
+                sim += self.simulateBatch(min(self.leafBatch, self.MCTSsimulations - sim))
+        else:
+            trace = lg.tracing(lg.logger_mcts)
+            for sim in range(self.MCTSsimulations):
+                if trace:
+                    lg.logger_mcts.info('***************************')
+                    lg.logger_mcts.info('****** SIMULATION %d ******', sim + 1)
+                    lg.logger_mcts.info('***************************')
+                self.simulate()
 
         # ### get action values
         pi, values = self.getAV(1)
@@ -94,65 +144,101 @@ class Agent():
         lg.logger_mcts.info('CHOSEN ACTION...%d', action)
         lg.logger_mcts.info('MCTS PERCEIVED VALUE...%f', value)
         lg.logger_mcts.info('NN PERCEIVED VALUE...%f', NN_value)
+        lg.logger_mcts.info('%s', self.cache)
 
         return (action, pi, value, NN_value)
 
     def get_preds(self, state):
-        # predict the leaf
-        inputToModel = np.array([self.model.convertToModelInput(state)])
-
-        preds = self.model.predict(inputToModel)
-        value_array = preds[0]
-        logits_array = preds[1]
-        value = value_array[0]
-
-        logits = logits_array[0]
-
-        allowedActions = state.allowedActions
-
-        mask = np.ones(logits.shape, dtype=bool)
-        mask[allowedActions] = False
-        logits[mask] = -100
-
-        # SOFTMAX
-        odds = np.exp(logits)
-        probs = odds / np.sum(odds)  # put this just before the for?
-
-        return ((value, probs, allowedActions))
+        return self.get_preds_batch([state])[0]
+
+    def get_preds_batch(self, states):
+        self.cache.sync((self.model.version, self.symmetries is None))
+
+        # look the leaves up in the cache and predict the rest with one call to the model
+        keys = [state.positionKey() for state in states]
+        outputs = [self.cache.get(key) for key in keys]
+        missing = [idx for idx, output in enumerate(outputs) if output is None]
+
+        if missing:
+            inputToModel = self.model.convertBatchToModelInput([states[idx] for idx in missing])
+
+            if self.symmetries is None:
+                preds = self.model.predict(inputToModel)
+            else:
+                preds = self.predictSymmetric(inputToModel)
+            value_array = preds[0]
+            logits_array = preds[1]
+
+            for row, idx in enumerate(missing):
+                # copies, so a cached row does not keep the whole batch output alive
+                outputs[idx] = (value_array[row].copy(), logits_array[row].copy())
+                self.cache.put(keys[idx], *outputs[idx])
+
+        rv = []
+        for state, (value, logits) in zip(states, outputs):
+            allowedActions = state.allowedActions
+
+            mask = np.ones(logits.shape, dtype=bool)
+            mask[allowedActions] = False
+            logits = np.where(mask, -100, logits)
+
+            # SOFTMAX
+            odds = np.exp(logits)
+            probs = odds / np.sum(odds)
+
+            rv.append((value, probs, allowedActions))
+
+        return rv
+
+    def predictSymmetric(self, inputToModel):
+        """
+        The network's value and logits averaged over every symmetric image of
+        each position. All the images go through a single predict call and
+        each image's logits are mapped back to the original actions first.
+        """
+        batch = len(inputToModel)
+        cells = int(np.prod(inputToModel.shape[2:]))
+        planes = inputToModel.reshape(inputToModel.shape[:2] + (cells,))
+
+        # (positions, planes, images, cells) -> (images * positions, planes, ...)
+        images = planes[:, :, self.symmetries[:, :cells]].transpose(2, 0, 1, 3)
+        value_array, logits_array = self.model.predict(images.reshape((-1,) + inputToModel.shape[1:]))
+
+        logits_array = logits_array.reshape(len(self.symmetries), batch, -1)
+        logits = np.zeros(logits_array.shape[1:], dtype=np.float64)
+        for perm, image_logits in zip(self.symmetries, logits_array):
+            logits[:, perm] += image_logits
+        logits /= len(self.symmetries)
+        value = value_array.reshape(len(self.symmetries), batch, -1).mean(axis=0)
+        return [value, logits]
 
     def evaluateLeaf(self, leaf, value, done, breadcrumbs):
-
-        lg.logger_mcts.info('------EVALUATING LEAF------')
+        trace = lg.tracing(lg.logger_mcts)
+        if trace:
+            lg.logger_mcts.info('------EVALUATING LEAF------')
+        state = self.mcts.states[leaf]
         if done == 0:
-            value, probs, allowedActions = self.get_preds(leaf.state)
-            lg.logger_mcts.info('PREDICTED VALUE FOR %d: %f', leaf.state.playerTurn, value)
-
-            probs = probs[allowedActions]
-
-            for idx, action in enumerate(allowedActions):
-                newState, _, _ = leaf.state.takeAction(action)
-                if newState.id not in self.mcts.tree:
-                    node = mc.Node(newState)
-                    self.mcts.addNode(node)
-                    lg.logger_mcts.info('added node...%s...p = %f', node.id, probs[idx])
-                else:
-                    node = self.mcts.tree[newState.id]
-                    lg.logger_mcts.info('existing node...%s...', node.id)
-                newEdge = mc.Edge(leaf, node, probs[idx], action)
-                leaf.edges.append((action, newEdge))
+            value, probs, allowedActions = self.get_preds(state)
+            if trace:
+                lg.logger_mcts.info('PREDICTED VALUE FOR %d: %f', state.playerTurn, value)
 
-        else:
-            lg.logger_mcts.info('GAME VALUE FOR %d: %f', leaf.playerTurn, value)
+            self.expandLeaf(leaf, probs, allowedActions)
+
+        elif trace:
+            lg.logger_mcts.info('GAME VALUE FOR %d: %f', state.playerTurn, value)
 
         return ((value, breadcrumbs))
 
+    def expandLeaf(self, leaf, probs, allowedActions):
+        self.mcts.expand(leaf, allowedActions, probs[allowedActions])
+
     def getAV(self, tau):
-        edges = self.mcts.root.edges
+        edges = self.mcts.children(self.mcts.root)
         pi = np.zeros(self.action_size, dtype=np.integer)
         values = np.zeros(self.action_size, dtype=np.float32)
-        for action, edge in edges:
-            pi[action] = pow(edge.stats['N'], 1/tau)
-            values[action] = edge.stats['Q']
+        actions = self.mcts.action[edges]
+        pi[actions] = np.power(self.mcts.N[edges], 1/tau)
+        values[actions] = self.mcts.Q[edges]
         pi = pi / (np.sum(pi) * 1.0)
         return pi, values
 
@@ -174,7 +260,7 @@ class Agent():
         for i in range(config.TRAINING_LOOPS):
             minibatch = random.sample(ltmemory, min(config.BATCH_SIZE, len(ltmemory)))
 
-            training_states = np.array([self.model.convertToModelInput(row['state']) for row in minibatch])
+            training_states = np.array([row['input'] if row['state'] is None else self.model.convertToModelInput(row['state']) for row in minibatch])
             training_targets = {'value_head': np.array([row['value'] for row in minibatch]),
                                 'policy_head': np.array([row['AV'] for row in minibatch])}
 
@@ -205,9 +291,10 @@ class Agent():
 
     def buildMCTS(self, state):
         lg.logger_mcts.info('****** BUILDING NEW MCTS TREE FOR AGENT %s ******', self.name)
-        self.root = mc.Node(state)
-        self.mcts = mc.MCTS(self.root, self.cpuct)
+        self.mcts = mc.MCTS(state, self.cpuct)
+        self.root = self.mcts.root
 
     def changeRootMCTS(self, state):
         lg.logger_mcts.info('****** CHANGING ROOT OF MCTS TREE TO %s FOR AGENT %s ******', state.id, self.name)
-        self.mcts.root = self.mcts.tree[state.id]
+        retained, freed = self.mcts.reroot(self.mcts.tree[state.id])
+        lg.logger_mcts.info('kept %d nodes, freed %d', retained, freed)
@@ -0,0 +1,842 @@
+'''
+Micro-benchmarks for the self-play hot paths.
+
+Usage:
+    python benchmark.py mcts [game] [simulations] [moves]
+    python benchmark.py batch [game] [simulations] [moves] [latency_ms]
+    python benchmark.py gomoves [board_size] [games]
+    python benchmark.py goengines [board_size] [games]
+    python benchmark.py golegal [board_size] [games]
+    python benchmark.py goscore [board_size] [games]
+    python benchmark.py goinput [board_size] [batch]
+    python benchmark.py reuse [game] [simulations] [moves]
+    python benchmark.py logging [game] [simulations] [moves]
+    python benchmark.py numpy [game]
+    python benchmark.py parity [write]
+    python benchmark.py quantize [games]
+    python benchmark.py symmetry [positions] [latency_ms]
+    python benchmark.py checkpoint [rounds]
+
+game is one of go, connect4, metasquares (default connect4). The Go engines'
+correctness checks are tests, run with python -m pytest tests.
+'''
+import ast
+import importlib.util
+import pickle
+import random
+import sys
+import time
+
+import numpy as np
+
+
+def load_game(name):
+    if name == 'go':
+        import game
+        return game.Game()
+    spec = importlib.util.spec_from_file_location(name + '_game', 'games/' + name + '/game.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Game()
+
+
+class UniformModel():
+    """Stands in for Residual_CNN so that only the search itself is timed."""
+
+    def __init__(self, action_size, latency=0.0):
+        self.action_size = action_size
+        self.latency = latency
+        self.calls = 0
+        self.version = 0
+
+    def convertToModelInput(self, state):
+        return state.binary
+
+    def convertBatchToModelInput(self, states):
+        return np.array([state.binary for state in states])
+
+    def predict(self, x):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [np.zeros((len(x), 1)), np.zeros((len(x), self.action_size))]
+
+
+def bench_mcts(game_name='connect4', simulations=400, moves=6):
+    from agent import Agent
+
+    np.random.seed(0)
+    random.seed(0)
+
+    env = load_game(game_name)
+    model = UniformModel(env.action_size)
+    agent = Agent('bench', env.state_size, env.action_size, simulations, 1, model)
+
+    state = env.reset()
+    nodes = 0
+    played = 0
+    elapsed = 0.0
+    for _ in range(moves):
+        start = time.perf_counter()
+        action, _, _, _ = agent.act(state, 1)
+        elapsed += time.perf_counter() - start
+        nodes += len(agent.mcts)
+        played += 1
+        state, _, done, _ = env.step(action)
+        agent.mcts = None
+        if done:
+            break
+
+    print('%s: %d simulations x %d moves, %d nodes in %.2fs -> %.0f nodes/s, %.0f simulations/s'
+          % (game_name, simulations, played, nodes, elapsed, nodes / elapsed, played * simulations / elapsed))
+    print(agent.cache)
+
+
+def bench_batch(game_name='connect4', simulations=400, moves=6, latency_ms=2):
+    """
+    Compare one leaf per model call against batched leaves with virtual loss.
+    latency_ms models the fixed per-call overhead of Keras predict.
+    """
+    from agent import Agent
+
+    env = load_game(game_name)
+    for leaf_batch in (1, 4, 8, 16, 32):
+        np.random.seed(0)
+        random.seed(0)
+        model = UniformModel(env.action_size, latency_ms / 1000.0)
+        agent = Agent('bench', env.state_size, env.action_size, simulations, 1, model, leaf_batch)
+
+        state = env.reset()
+        played = 0
+        elapsed = 0.0
+        for _ in range(moves):
+            start = time.perf_counter()
+            action, _, _, _ = agent.act(state, 1)
+            elapsed += time.perf_counter() - start
+            played += 1
+            state, _, done, _ = env.step(action)
+            agent.mcts = None
+            if done:
+                break
+
+        print('%s: batch %2d, %d predict calls, %.0f simulations/s'
+              % (game_name, leaf_batch, model.calls, played * simulations / elapsed))
+
+
+def pickleTakeAction(board, flat_array_index):
+    """
+    Board.takeAction as it was before Board.copy, kept as the reference.
+    The old version also pickled the chain of earlier children hanging off
+    newState; that is dropped here so only the round trip itself is timed.
+    """
+    board.newState = None
+    board.newState = pickle.loads(pickle.dumps(board))
+    if flat_array_index != board.PASS_INDEX:
+        loc = (flat_array_index // board.board_size, flat_array_index % board.board_size)
+        value, done = board.newState.take_action(loc)
+    else:
+        value, done = board.newState.player_pass()
+
+    if board.newState._checkForEndGame() == 1:
+        board.newState.value = board.newState._getValue()
+        board.newState.score = board.newState._getScore()
+        winner = board.newState._score()
+        if winner == board.newState.playerTurn:
+            value = 1
+        else:
+            value = -1
+        done = 1
+
+    return board.newState, value, done
+
+
+def bench_gomoves(board_size=9, games=2):
+    """
+    Expand every legal move along random Go games, the way Agent.evaluateLeaf
+    does, with Board.takeAction and with the old pickle round trip.
+    Stops with an AssertionError if the two disagree on any child.
+    """
+    from go_board import Board
+
+    random.seed(0)
+    timings = {'pickle': 0.0, 'copy': 0.0}
+    moves = 0
+    for _ in range(games):
+        reference = Board(board_size, playerTurn=1)
+        board = pickle.loads(pickle.dumps(reference))
+        done = 0
+        while not done:
+            start = time.perf_counter()
+            expected = [pickleTakeAction(reference, a) for a in reference.allowedActions]
+            timings['pickle'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            children = [board.takeAction(a) for a in board.allowedActions]
+            timings['copy'] += time.perf_counter() - start
+
+            moves += len(children)
+            for (s1, v1, d1), (s2, v2, d2) in zip(expected, children):
+                assert (s1.id, v1, d1, s1.score) == (s2.id, v2, d2, s2.score)
+
+            action = random.choice(list(board.allowedActions))
+            reference, _, _ = pickleTakeAction(reference, action)
+            board, _, done = board.takeAction(action)
+
+    for name, elapsed in timings.items():
+        print('%dx%d %s: %d moves in %.2fs -> %.0f moves/s' % (board_size, board_size, name, moves, elapsed, moves / elapsed))
+
+
+def bench_goengines(board_size=9, games=2):
+    """
+    Time expanding every legal move along random games with go_board.Board
+    and go_bitboard.BitBoard. tests/test_go_engines.py checks that the two
+    agree.
+    """
+    from go_bitboard import BitBoard
+    from go_board import Board
+
+    random.seed(0)
+    timings = {'Board': 0.0, 'BitBoard': 0.0}
+    moves = 0
+    for _ in range(games):
+        reference = Board(board_size, playerTurn=1)
+        board = BitBoard(board_size, playerTurn=1)
+        done = 0
+        while not done:
+            start = time.perf_counter()
+            for a in reference.allowedActions:
+                reference.takeAction(a)
+            timings['Board'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            for a in board.allowedActions:
+                board.takeAction(a)
+            timings['BitBoard'] += time.perf_counter() - start
+
+            moves += len(board.allowedActions)
+            action = random.choice(list(board.allowedActions))
+            reference, _, _ = reference.takeAction(action)
+            board, _, done = board.takeAction(action)
+
+    for name, elapsed in timings.items():
+        print('%dx%d %s: %d moves in %.2fs -> %.0f moves/s' % (board_size, board_size, name, moves, elapsed, moves / elapsed))
+
+def bench_golegal(board_size=9, games=2):
+    """
+    Time Board.act, which now keeps the legal moves up to date from the
+    points around the move, against the same move with the legal moves
+    rebuilt from every empty point (twice, as _convertStateToId used to),
+    grouped by the number of empty points before the move.
+    tests/test_go_engines.py checks that the two agree.
+    """
+    from go_board import Board
+    from tests.go_reference import full_scan_legal
+
+    class FullScanBoard(Board):
+
+        def update_legal(self, changed):
+            pass
+
+        def _allowedActions(self):
+            full_scan_legal(self, self.playerTurn)
+            legal = full_scan_legal(self, self.playerTurn)
+            legal.append(self.PASS_INDEX)
+            return np.array(legal)
+
+    random.seed(0)
+    width = max(1, board_size ** 2 // 8)
+    timings = {}
+    for _ in range(games):
+        board = Board(board_size, playerTurn=1)
+        done = 0
+        while not done:
+            action = random.choice(list(board.allowedActions))
+            if action != board.PASS_INDEX:
+                loc = divmod(action, board_size)
+                bucket = timings.setdefault((board_size ** 2 - board.stones) // width, [0, 0.0, 0.0])
+
+                full = board.copy()
+                full.__class__ = FullScanBoard
+                start = time.perf_counter()
+                full.act(loc)
+                bucket[1] += time.perf_counter() - start
+
+                incremental = board.copy()
+                start = time.perf_counter()
+                incremental.act(loc)
+                bucket[2] += time.perf_counter() - start
+
+                bucket[0] += 1
+            board, _, done = board.takeAction(action)
+
+    print('%dx%d, microseconds per move' % (board_size, board_size))
+    print('  empty points    moves   full scan  incremental')
+    for key in sorted(timings, reverse=True):
+        moves, full, incremental = timings[key]
+        print('  %3d-%-3d       %7d   %9.0f  %11.0f'
+              % (key * width, key * width + width - 1, moves, full / moves * 1e6, incremental / moves * 1e6))
+
+def bench_goscore(board_size=9, games=20):
+    """
+    Time Board.territory against the Dragon scorer it replaced on every
+    position of random games. tests/test_go_engines.py checks that the two
+    agree.
+    """
+    from go_board import Board
+    from tests.go_reference import DragonScorer
+
+    random.seed(0)
+    timings = {'set_empty_dragons': 0.0, 'territory': 0.0}
+    positions = 0
+    for _ in range(games):
+        board = Board(board_size, playerTurn=1)
+        done = 0
+        while not done:
+            start = time.perf_counter()
+            DragonScorer(board).set_empty_dragons()
+            timings['set_empty_dragons'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            board.territory()
+            timings['territory'] += time.perf_counter() - start
+
+            positions += 1
+
+            action = random.choice(list(board.allowedActions))
+            board, _, done = board.takeAction(action)
+
+    for name, elapsed in timings.items():
+        print('%dx%d %s: %d positions in %.2fs -> %.0f us each' % (board_size, board_size, name, positions, elapsed, elapsed / positions * 1e6))
+
+def bench_goinput(board_size=9, batch=64):
+    """
+    Encode batches of Go states for the network, one array per state and
+    then np.array, against Residual_CNN.convertBatchToModelInput, which
+    writes every state straight into one preallocated batch.
+    """
+    from go_board import Board
+
+    random.seed(0)
+    states = []
+    board = Board(board_size, playerTurn=1)
+    while len(states) < batch:
+        states.append(board)
+        board, _, done = board.takeAction(random.choice(list(board.allowedActions)))
+        if done:
+            board = Board(board_size, playerTurn=1)
+
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        separate = np.array([state.dump_state_example() for state in states])
+    elapsed = time.perf_counter() - start
+    print('%dx%d per state: %.0f us per batch of %d' % (board_size, board_size, elapsed / rounds * 1e6, batch))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        batched = np.empty((batch, 15, board_size, board_size), dtype=np.int8)
+        for row, state in enumerate(states):
+            state.dump_state_example(out=batched[row])
+    elapsed = time.perf_counter() - start
+    print('%dx%d batched:   %.0f us per batch of %d' % (board_size, board_size, elapsed / rounds * 1e6, batch))
+    assert (separate == batched).all()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for state in states:
+            state.update_history()
+    elapsed = time.perf_counter() - start
+    print('%dx%d update_history: %.1f us' % (board_size, board_size, elapsed / rounds / batch * 1e6))
+
+
+def subtreeStats(mcts, node):
+    """ (state id, action) -> (N, W, Q, P) for every edge reachable from node """
+    stats = {}
+    for n in mcts.reachable(node):
+        edges = mcts.children(n)
+        for edge in range(edges.start, edges.stop):
+            stats[(mcts.states[n].id, mcts.action[edge])] = (mcts.N[edge], mcts.W[edge], mcts.Q[edge], mcts.P[edge])
+    return stats
+
+
+def bench_reuse(game_name='go', simulations=200, moves=30):
+    """
+    Keep one tree for a whole game and compare its size when the root only
+    moves (the old changeRootMCTS) with pruning on every re-root. The
+    pruning run also checks that the kept subtree's statistics survive.
+    """
+    from agent import Agent
+
+    class MoveRootAgent(Agent):
+        def changeRootMCTS(self, state):
+            self.mcts.root = self.mcts.tree[state.id]
+
+    class PruningAgent(Agent):
+        retained = 0
+        freed = 0
+
+        def changeRootMCTS(self, state):
+            before = subtreeStats(self.mcts, self.mcts.tree[state.id])
+            size = len(self.mcts)
+            Agent.changeRootMCTS(self, state)
+            assert subtreeStats(self.mcts, self.mcts.root) == before
+            self.retained += len(self.mcts)
+            self.freed += size - len(self.mcts)
+
+    env = load_game(game_name)
+    for agent_class in (MoveRootAgent, PruningAgent):
+        np.random.seed(0)
+        random.seed(0)
+        model = UniformModel(env.action_size)
+        agent = agent_class('bench', env.state_size, env.action_size, simulations, 1, model)
+
+        state = env.reset()
+        peak = 0
+        for played in range(1, moves + 1):
+            action, _, _, _ = agent.act(state, 1)
+            peak = max(peak, len(agent.mcts))
+            state, _, done, _ = env.step(action)
+            if done:
+                break
+
+        print('%s %s: %d moves, peak %d nodes, %d pool slots at the end'
+              % (game_name, agent_class.__name__, played, peak, len(agent.mcts.nodePlayer)))
+        if agent_class is PruningAgent:
+            print('%s %s: %d nodes retained, %d freed over the game'
+                  % (game_name, agent_class.__name__, agent.retained, agent.freed))
+
+
+class StripMCTSLogging(ast.NodeTransformer):
+    """ Removes the logger_mcts calls, the trace flags and everything guarded by them """
+
+    def isTrace(self, node):
+        if isinstance(node, ast.Name) and node.id == 'trace':
+            return True
+        return any(isinstance(n, ast.Attribute) and n.attr == 'logger_mcts' or isinstance(n, ast.Name) and n.id == 'logger_mcts'
+                   for n in ast.walk(node))
+
+    def body(self, statements):
+        statements = [s for s in (self.visit(s) for s in statements) if s is not None]
+        return statements or [ast.Pass()]
+
+    def generic_visit(self, node):
+        for field in ('body', 'orelse', 'finalbody'):
+            if isinstance(getattr(node, field, None), list):
+                setattr(node, field, self.body(getattr(node, field)))
+        return node
+
+    def visit_If(self, node):
+        if self.isTrace(node.test):
+            return node.orelse[0] if node.orelse else None
+        return self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        if any(self.isTrace(target) for target in node.targets):
+            return None
+        return node
+
+    def visit_Expr(self, node):
+        if self.isTrace(node):
+            return None
+        return node
+
+
+def strippedModule(name, path):
+    tree = StripMCTSLogging().visit(ast.parse(open(path).read()))
+    module = type(sys)(name)
+    exec(compile(ast.fix_missing_locations(tree), path, 'exec'), module.__dict__)
+    return module
+
+
+def bench_logging(game_name='connect4', simulations=400, moves=6, rounds=5):
+    """
+    The cost of the MCTS logging while logger_mcts is disabled: the real
+    search against a copy of MCTS.py and agent.py with every logging
+    statement taken out of the source.
+    """
+    import agent
+    import loggers as lg
+
+    assert not lg.tracing(lg.logger_mcts), 'disable the mcts logger in loggers.LOGGER_DISABLED first'
+
+    stripped = strippedModule('agent_stripped', 'agent.py')
+    stripped.mc = strippedModule('MCTS_stripped', 'MCTS.py')
+
+    env = load_game(game_name)
+    best = {}
+    for _ in range(rounds):
+        for label, module in (('no logging calls', stripped), ('logging disabled', agent)):
+            np.random.seed(0)
+            random.seed(0)
+            player = module.Agent('bench', env.state_size, env.action_size, simulations, 1, UniformModel(env.action_size))
+            state = env.reset()
+            elapsed = 0.0
+            for _ in range(moves):
+                start = time.perf_counter()
+                action, _, _, _ = player.act(state, 1)
+                elapsed += time.perf_counter() - start
+                state, _, done, _ = env.step(action)
+                player.mcts = None
+                if done:
+                    break
+            best[label] = min(best.get(label, elapsed), elapsed)
+
+    for label, elapsed in best.items():
+        print('%s %s: %.3fs' % (game_name, label, elapsed))
+    print('%s overhead of disabled logging: %.1f%%'
+          % (game_name, 100 * (best['logging disabled'] / best['no logging calls'] - 1)))
+
+
+class KerasLayer():
+    """ The parts of a Keras layer that NumpyModel.fromKeras reads """
+
+    def __init__(self, name, weights, epsilon=1e-3):
+        self.name = name
+        self.weights = weights
+        self.epsilon = epsilon
+
+    def get_weights(self):
+        return self.weights
+
+
+def randomKerasNN(input_dim, output_dim, hidden_layers, rng):
+    """ An object shaped like a trained Residual_CNN, with random weights and batch norm statistics """
+    from numpy_model import layout
+
+    layers = []
+    for name, shape in layout(input_dim, output_dim, hidden_layers):
+        if name.endswith('_bias'):
+            continue
+        fan_in = int(np.prod(shape[:-1]))
+        layers.append(KerasLayer(name, [rng.normal(0, 1 / np.sqrt(fan_in), shape).astype(np.float32)]))
+        if len(shape) == 4:
+            filters = shape[-1]
+            layers.append(KerasLayer(name.replace('conv', 'bn'), [rng.uniform(0.5, 1.5, filters), rng.normal(0, 0.1, filters),
+                                                                rng.normal(0, 0.1, filters), rng.uniform(0.5, 1.5, filters)]))
+
+    class Model():
+        pass
+
+    nn = Model()
+    nn.model = Model()
+    nn.model.layers = layers
+    nn.input_dim = input_dim
+    nn.output_dim = output_dim
+    nn.hidden_layers = hidden_layers
+    return nn
+
+
+def referencePredict(nn, x, alpha=0.3):
+    """ The Keras graph computed layer by layer in channels-first order, batch norm unfolded """
+    layers = {layer.name: layer for layer in nn.model.layers}
+
+    def leaky(x):
+        return np.where(x > 0, x, alpha * x)
+
+    def conv_bn(x, name):
+        kernel = layers[name].get_weights()[0]
+        bn = layers[name.replace('conv', 'bn')]
+        gamma, beta, mean, variance = bn.get_weights()
+        kh, kw, _, filters = kernel.shape
+        batch, _, height, width = x.shape
+        padded = np.zeros(x.shape[:2] + (height + kh - 1, width + kw - 1))
+        padded[:, :, (kh - 1) // 2:(kh - 1) // 2 + height, (kw - 1) // 2:(kw - 1) // 2 + width] = x
+        out = np.zeros((batch, filters, height, width))
+        for i in range(kh):
+            for j in range(kw):
+                out += np.einsum('bchw,cf->bfhw', padded[:, :, i:i + height, j:j + width], kernel[i, j])
+        shape = (1, filters, 1, 1)
+        return (out - mean.reshape(shape)) / np.sqrt(variance.reshape(shape) + bn.epsilon) * gamma.reshape(shape) + beta.reshape(shape)
+
+    x = x.astype(np.float64)
+    x = leaky(conv_bn(x, 'conv_0'))
+    for idx in range(1, len(nn.hidden_layers)):
+        y = leaky(conv_bn(x, 'conv_%d' % idx))
+        x = leaky(x + conv_bn(y, 'conv_%d_b' % idx))
+
+    v = leaky(conv_bn(x, 'value_conv')).reshape(len(x), -1)
+    v = leaky(v.dot(layers['value_dense'].get_weights()[0]))
+    v = np.tanh(v.dot(layers['value_head'].get_weights()[0]))
+    p = leaky(conv_bn(x, 'policy_conv')).reshape(len(x), -1)
+    p = p.dot(layers['policy_head'].get_weights()[0])
+    return [v, p]
+
+
+def bench_numpy(game_name='connect4', rounds=200):
+    """
+    Check NumpyModel (batch norm folded, im2col convolutions) against the
+    layer-by-layer reference, and against Residual_CNN.predict when Keras is
+    installed, then time small batches.
+    """
+    import os
+    import tempfile
+
+    import config
+    from numpy_model import NumpyModel, export
+
+    env = load_game(game_name)
+    input_dim = (15,) + env.grid_shape
+    rng = np.random.RandomState(0)
+    batches = {size: rng.randint(0, 2, (size,) + input_dim).astype(np.int8) for size in (1, 8, 64)}
+
+    nn = randomKerasNN(input_dim, env.action_size, config.HIDDEN_CNN_LAYERS, rng)
+    model = NumpyModel.fromKeras(nn)
+    path = os.path.join(tempfile.mkdtemp(), 'model.npz')
+    export(nn, path)
+    loaded = NumpyModel.load(path)
+
+    x = batches[64]
+    expected = referencePredict(nn, x)
+    for got in (model.predict(x), loaded.predict(x)):
+        for e, g in zip(expected, got):
+            assert e.shape == g.shape
+            assert np.allclose(e, g, atol=1e-4), np.abs(e - g).max()
+    print('%s: NumpyModel matches the reference, max abs error value %.1e, policy %.1e'
+          % (game_name, np.abs(expected[0] - got[0]).max(), np.abs(expected[1] - got[1]).max()))
+
+    candidates = [('numpy', model)]
+    try:
+        from model import Residual_CNN
+    except ImportError:
+        print('%s: Keras is not installed, skipping the comparison with Residual_CNN.predict' % game_name)
+    else:
+        keras_nn = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, input_dim, env.action_size, config.HIDDEN_CNN_LAYERS)
+        keras_nn.set_weights([w * rng.uniform(0.5, 1.5, w.shape) for w in keras_nn.model.get_weights()])
+        expected = keras_nn.predict(x)
+        got = NumpyModel.fromKeras(keras_nn).predict(x)
+        print('%s: NumpyModel vs Residual_CNN.predict, max abs error value %.1e, policy %.1e'
+              % (game_name, np.abs(expected[0] - got[0]).max(), np.abs(expected[1] - got[1]).max()))
+        candidates.append(('keras', keras_nn))
+
+    for label, candidate in candidates:
+        for size, x in batches.items():
+            candidate.predict(x)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                candidate.predict(x)
+            elapsed = (time.perf_counter() - start) / rounds
+            print('%s %s: batch %2d, %.0f us per call' % (game_name, label, size, elapsed * 1e6))
+
+
+def bench_parity(write=0):
+    """
+    Check NumpyModel against the outputs of a real Residual_CNN saved in
+    numpy_model.PARITY_FIXTURE. With write=1, which needs Keras, first
+    rewrite the fixture from a small Residual_CNN with random weights and
+    batch norm statistics, on connect4-sized inputs.
+    """
+    import config
+    from numpy_model import PARITY_FIXTURE, checkParity, writeParityFixture
+
+    if write:
+        from model import Residual_CNN
+        env = load_game('connect4')
+        input_dim = (15,) + env.grid_shape
+        # an even and an odd kernel, to cover both ways of padding, and a residual layer
+        hidden_layers = [{'filters': 8, 'kernel_size': (2, 2)}, {'filters': 8, 'kernel_size': (3, 3)}]
+        rng = np.random.RandomState(0)
+        nn = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, input_dim, env.action_size, hidden_layers, compile=False)
+        for layer in nn.model.layers:
+            weights = layer.get_weights()
+            if layer.name.startswith('bn_') or layer.name.endswith('_bn'):
+                filters = len(weights[0])
+                layer.set_weights([rng.uniform(0.5, 1.5, filters), rng.normal(0, 0.1, filters),
+                                   rng.normal(0, 0.1, filters), rng.uniform(0.5, 1.5, filters)])
+            elif weights:
+                layer.set_weights([rng.normal(0, 1 / np.sqrt(np.prod(w.shape[:-1])), w.shape) for w in weights])
+        writeParityFixture(nn, rng.randint(0, 2, (16,) + input_dim).astype(np.int8))
+        print('wrote %s' % PARITY_FIXTURE)
+
+    print('NumpyModel matches Keras on %s, max abs error value %.1e, policy %.1e' % ((PARITY_FIXTURE,) + checkParity()))
+
+
+def selfPlayMemory(env, model, games, simulations=50):
+    """ A replay memory filled by an Agent with model playing itself """
+    import config
+    from agent import Agent
+    from memory import Memory
+
+    memory = Memory(config.MEMORY_SIZE)
+    agent = Agent('bench', env.state_size, env.action_size, simulations, 1, model)
+    for _ in range(games):
+        state = env.reset()
+        agent.mcts = None
+        done = 0
+        while not done:
+            action, pi, _, _ = agent.act(state, 1)
+            memory.commit_stmemory(env.identities, state, pi)
+            state, _, done, _ = env.step(action)
+        memory.commit_ltmemory()
+    return memory
+
+
+def bench_quantize(games=4, rounds=100):
+    """
+    Post-training float16 and int8 versions of a NumpyModel: bytes held,
+    agreement with the float32 model on held-out replay positions, and
+    speed. int8 is calibrated either on other positions from
+    the same replay memory or on random games, as actors do before their
+    first self-play. Only the Go states provide the 15-plane model input.
+    """
+    game_name = 'go'
+    import config
+    from numpy_model import NumpyModel, QuantizedModel, agreement, memoryInputs, randomInputs
+
+    np.random.seed(0)
+    random.seed(0)
+    env = load_game(game_name)
+    input_dim = (15,) + env.grid_shape
+    model = NumpyModel.fromKeras(randomKerasNN(input_dim, env.action_size, config.HIDDEN_CNN_LAYERS, np.random.RandomState(0)))
+
+    memory = selfPlayMemory(env, model, games)
+    positions = memoryInputs(memory.ltmemory, model, len(memory.ltmemory))
+    calibration, held_out = positions[:len(positions) // 2], positions[len(positions) // 2:]
+    print('%s: %d replay positions, %d for calibration, %d held out' % (game_name, len(positions), len(calibration), len(held_out)))
+
+    float16 = QuantizedModel.fromModel(model, 'float16')
+    random_games = QuantizedModel.fromModel(model, 'int8')
+    random_games.calibrate(randomInputs(env, model, len(calibration)))
+    calibrated = QuantizedModel.fromModel(model, 'int8')
+    calibrated.calibrate(calibration)
+
+    uncalibrated = QuantizedModel.fromModel(model, 'int8')
+    try:
+        uncalibrated.predict(held_out[:1])
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError('an uncalibrated int8 model predicted')
+
+    for label, candidate in (('float32', model), ('float16', float16), ('int8 random games', random_games), ('int8 calibrated', calibrated)):
+        report = agreement(model, candidate, held_out)
+        timings = []
+        for size in (1, 64):
+            x = held_out[:size]
+            start = time.perf_counter()
+            for _ in range(rounds):
+                candidate.predict(x)
+            timings.append((time.perf_counter() - start) / rounds * 1e6)
+        print('%s %-22s %7d bytes, value mae %.4f max %.4f, policy top-1 %.3f tv %.4f, %.0f us (batch 1) %.0f us (batch 64)'
+              % (game_name, label, candidate.nbytes, report['value_mae'], report['value_max'], report['policy_top1'], report['policy_tv'], timings[0], timings[1]))
+
+
+def randomGoStates(env, count):
+    """ Positions from random Go games """
+    states = []
+    while len(states) < count:
+        state = env.reset()
+        done = 0
+        while not done and len(states) < count:
+            states.append(state)
+            state, _, done, _ = env.step(random.choice(list(state.allowedActions)))
+    return states
+
+
+def bench_symmetry(positions=64, latency_ms=2, rounds=50):
+    """
+    Symmetry-averaged evaluation on Go: check it against the average of one
+    predict per image and that it is equivariant, then time one batched call
+    for all images against a call per image, with NumpyModel and with a
+    model that has latency_ms of fixed overhead per call.
+    """
+    import config
+    from agent import Agent
+    from numpy_model import NumpyModel
+
+    np.random.seed(0)
+    random.seed(0)
+    env = load_game('go')
+    table = env.symmetries
+    model = NumpyModel.fromKeras(randomKerasNN((15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS, np.random.RandomState(0)))
+    agent = Agent('bench', env.state_size, env.action_size, 1, 1, model, symmetries=table)
+
+    x = model.convertBatchToModelInput(randomGoStates(env, positions))
+    cells = env.grid_shape[0] * env.grid_shape[1]
+    flat = x.reshape(x.shape[:2] + (cells,))
+    images = [flat[:, :, perm[:cells]].reshape(x.shape) for perm in table]
+
+    value, logits = agent.predictSymmetric(x)
+    separate = [model.predict(image) for image in images]
+    expected = np.zeros_like(logits)
+    for perm, (_, image_logits) in zip(table, separate):
+        expected[:, perm] += image_logits
+    assert np.allclose(logits, expected / len(table), atol=1e-5)
+    assert np.allclose(value, np.mean([v for v, _ in separate], axis=0), atol=1e-6)
+    for perm, image in zip(table, images):
+        image_value, image_logits = agent.predictSymmetric(image)
+        assert np.allclose(image_logits, logits[:, perm], atol=1e-5)
+        assert np.allclose(image_value, value, atol=1e-6)
+    print('go: averaged predictions match the per-image average and are equivariant over %d symmetries' % len(table))
+
+    for label, m in (('numpy', model), ('%d ms latency' % latency_ms, UniformModel(env.action_size, latency_ms / 1000.0))):
+        agent.model = m
+        leaf = x[:1]
+        leaf_images = [image[:1] for image in images]
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for image in leaf_images:
+                m.predict(image)
+        per_image = (time.perf_counter() - start) / rounds
+        start = time.perf_counter()
+        for _ in range(rounds):
+            agent.predictSymmetric(leaf)
+        batched = (time.perf_counter() - start) / rounds
+        print('go %s: one leaf, %d predict calls %.0f us, one batched call %.0f us'
+              % (label, len(table), per_image * 1e6, batched * 1e6))
+
+
+def bench_checkpoint(rounds=50):
+    """
+    Save and load the weights of a Go network of config.HIDDEN_CNN_LAYERS
+    as a weights checkpoint, checking the round trip; pickle for comparison.
+    """
+    import os
+    import tempfile
+
+    import config
+    from checkpoint import read_weights, write_weights
+
+    env = load_game('go')
+    nn = randomKerasNN((15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS, np.random.RandomState(0))
+    weights = [np.asarray(w, dtype=np.float32) for layer in nn.model.layers for w in layer.get_weights()]
+    shapes = [w.shape for w in weights]
+    path = os.path.join(tempfile.mkdtemp(), 'version0001')
+
+    write_weights(path, weights)
+    loaded = read_weights(path, shapes)
+    assert all(np.array_equal(a, b) for a, b in zip(weights, loaded))
+    try:
+        read_weights(path, shapes[::-1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('a shape mismatch was not caught')
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - start) / rounds * 1e3
+
+    def pickleSave():
+        with open(path + '.p', 'wb') as f:
+            pickle.dump(weights, f)
+
+    def pickleLoad():
+        with open(path + '.p', 'rb') as f:
+            return pickle.load(f)
+
+    print('go: %d weight arrays, %d bytes' % (len(weights), os.path.getsize(path + '.npy')))
+    print('checkpoint: save %.2f ms, load (mmap) %.3f ms, load and copy %.2f ms'
+          % (timed(lambda: write_weights(path, weights)), timed(lambda: read_weights(path, shapes)),
+             timed(lambda: [np.array(w) for w in read_weights(path, shapes)])))
+    print('pickle:     save %.2f ms, load %.2f ms' % (timed(pickleSave), timed(pickleLoad)))
+
+
+if __name__ == '__main__':
+    benchmarks = {'mcts': bench_mcts, 'batch': bench_batch, 'gomoves': bench_gomoves, 'goengines': bench_goengines, 'golegal': bench_golegal, 'goscore': bench_goscore, 'goinput': bench_goinput, 'reuse': bench_reuse, 'logging': bench_logging, 'numpy': bench_numpy, 'parity': bench_parity, 'quantize': bench_quantize, 'symmetry': bench_symmetry, 'checkpoint': bench_checkpoint}
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print(__doc__)
+        sys.exit(1)
+    args = [a if not a.isdigit() else int(a) for a in sys.argv[2:]]
+    benchmarks[sys.argv[1]](*args)
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+
+class EvalCache():
+    """
+    Bounded LRU cache of raw network outputs keyed by state.positionKey().
+
+    Entries hold the value and the unmasked logits, so a hit is valid for
+    any state whose model input matches, whatever its allowed actions. The
+    cache empties itself when the version of the model it was filled from
+    changes, i.e. after set_weights or fit.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return 'EvalCache(size=%d, entries=%d, hits=%d, misses=%d)' % (self.size, len(self.entries), self.hits, self.misses)
+
+    def sync(self, version):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, value, logits):
+        if self.size <= 0:
+            return
+        self.entries[key] = (value, logits)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
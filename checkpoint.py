@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+
+
+def flatten(weights):
+    """ A list of weight arrays as one flat float32 array """
+    return np.concatenate([np.ravel(w) for w in weights]).astype(np.float32)
+
+
+def unflatten(flat, shapes):
+    """ Split a flat array back into arrays of the given shapes, as views where possible """
+    weights = []
+    start = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        weights.append(flat[start:start + size].reshape(shape))
+        start += size
+    return weights
+
+
+def write_weights(path, weights, names=None):
+    """
+    Save weights as path.npy, one flat float32 array, and path.json, the
+    manifest of their shapes (and names, if given) in order.
+    """
+    manifest = {'dtype': 'float32',
+                'shapes': [list(np.shape(w)) for w in weights]}
+    if names is not None:
+        manifest['names'] = list(names)
+    np.save(path + '.npy', flatten(weights))
+    with open(path + '.json', 'w') as f:
+        json.dump(manifest, f)
+
+
+def read_manifest(path):
+    with open(path + '.json') as f:
+        return json.load(f)
+
+
+def read_weights(path, shapes=None, mmap=True):
+    """
+    The weights saved by write_weights. With mmap the arrays are read-only
+    views of the memory-mapped file, so nothing is read until they are used.
+    shapes, if given, must match the manifest.
+    """
+    manifest = read_manifest(path)
+    saved = [tuple(shape) for shape in manifest['shapes']]
+    if shapes is not None and [tuple(shape) for shape in shapes] != saved:
+        raise ValueError('checkpoint %s holds weights of shapes %s, not %s' % (path, saved, [tuple(shape) for shape in shapes]))
+    flat = np.load(path + '.npy', mmap_mode='r' if mmap else None)
+    # plain views of the map: slicing a np.memmap costs more than the read
+    return unflatten(flat.view(np.ndarray), saved)
@@ -1,3 +1,10 @@
+#### GAME
+# Go board implementation: 'dragon' (go_board.Board) or 'bitboard' (go_bitboard.BitBoard)
+GO_ENGINE = 'dragon'
+# seed of the Zobrist table shared by every board of a size, so hashes agree across games and processes
+ZOBRIST_SEED = 0
+
+
 #### SELF PLAY
 # EPISODES = 5
 # MCTS_SIMS = 50
@@ -15,6 +22,36 @@ CPUCT = 1
 EPSILON = 0.2
 ALPHA = 0.8
 
+# leaves collected per model call; 1 evaluates every simulation on its own
+MCTS_BATCH_SIZE = 1
+# MCTS_BATCH_SIZE = 16
+VIRTUAL_LOSS = 1
+
+# games played at once, sharing one batched InferenceServer per network
+CONCURRENT_GAMES = 1
+# CONCURRENT_GAMES = 64
+INFERENCE_BATCH_SIZE = 64
+INFERENCE_TIMEOUT = 0.002
+
+# self-play processes feeding the learner; 0 plays in the learner's process
+SELF_PLAY_ACTORS = 0
+# SELF_PLAY_ACTORS = 31
+# actors predict with numpy_model.NumpyModel and never import TensorFlow; the
+# pool refuses to start until keras_parity.npz exists and matches
+# (python benchmark.py parity 1, with Keras installed)
+NUMPY_INFERENCE = False
+# NUMPY_INFERENCE = True
+# with NUMPY_INFERENCE, play the actors with quantized weights, None, 'float16' or
+# 'int8', to see what quantization costs in strength. NumPy holds and multiplies
+# them as float32, so it saves no memory, is no faster than None, and int8 is
+# slower (python benchmark.py quantize).
+# int8 calibrates on random games, then on the actor's last batch of self-play
+INFERENCE_QUANTIZATION = None
+# INFERENCE_QUANTIZATION = 'int8'
+
+# network outputs kept per agent, keyed by position; 0 disables the cache
+EVAL_CACHE_SIZE = 100000
+
 
 #### RETRAINING
 BATCH_SIZE = 256
@@ -36,3 +73,7 @@ HIDDEN_CNN_LAYERS = [
 #### EVALUATION
 EVAL_EPISODES = 20
 SCORING_THRESHOLD = 1.3
+# tournament players average the network over the board symmetries, all of
+# them in one batched predict per evaluation; self-play always uses the plain network
+EVAL_SYMMETRIES = False
+# EVAL_SYMMETRIES = True
@@ -2,7 +2,23 @@ import numpy as np
 import logging
 import pickle
 
+import config
 from go_board import Board
+from go_bitboard import BitBoard
+
+ENGINES = {'dragon': Board, 'bitboard': BitBoard}
+
+
+def boardSymmetries(board_size):
+    """
+    The eight rotations and reflections of the board as permutations of the
+    action space, the identity first and pass fixed as the last action.
+    Row k of a permuted action array is actions[symmetries[k]], and the same
+    permutation of the cells applies to every model input plane.
+    """
+    cells = np.arange(board_size ** 2).reshape(board_size, board_size)
+    images = [np.rot90(c, -turns).flatten() for c in (cells, cells[:, ::-1]) for turns in range(4)]
+    return np.array([np.append(image, board_size ** 2) for image in images])
 
 
 class Game:
@@ -10,17 +26,19 @@ class Game:
     def __init__(self):     
         self.currentPlayer = 1
         self.board_size = 4
-        self.gameState = Board(board_size=self.board_size, playerTurn=-1)
+        self.engine = ENGINES[config.GO_ENGINE]
+        self.gameState = self.engine(board_size=self.board_size, playerTurn=-1)
         self.actionSpace = self.gameState.action_space
         self.pieces = {'1':'X', '0': '-', '-1':'O'}
         self.grid_shape = (self.gameState.board_size, self.gameState.board_size)
         self.input_shape = (2, self.grid_shape[0], self.grid_shape[1])
         self.name = 'Go'
+        self.symmetries = boardSymmetries(self.board_size)
         self.state_size = len(self.gameState.binary)
         self.action_size = len(self.actionSpace)
 
     def reset(self):
-        self.gameState = Board(self.board_size, playerTurn=1)
+        self.gameState = self.engine(self.board_size, playerTurn=1)
         self.currentPlayer = 1
         return self.gameState
 
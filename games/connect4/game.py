@@ -1,6 +1,33 @@
 import numpy as np
 import logging
 
+# Bitboard layout: column c holds bits 7c (bottom row) to 7c + 5 (top row), and bit 7c + 6
+# stays empty so that shifts never carry one column's pieces into the next.
+# Cell i of the 42-cell board (row i // 7 from the top, column i % 7) lives at CELL_BITS[i].
+CELL_BITS = np.array([7 * (i % 7) + 5 - i // 7 for i in range(42)], dtype=np.int64)
+FULL_BOARD = sum(1 << int(bit) for bit in CELL_BITS)
+
+# The symmetry group of the board as permutations of the 42 cells: the identity and the
+# left-right mirror. Row k of a permuted board is board[SYMMETRIES[k]].
+CELLS = np.arange(42).reshape(6, 7)
+SYMMETRIES = np.array([CELLS.flatten(), CELLS[:, ::-1].flatten()])
+
+
+def symmetries(boards, actionValues):
+	# every symmetric image of a board or a batch of boards and of their action values,
+	# along a new axis before the cells
+	return boards[..., SYMMETRIES], actionValues[..., SYMMETRIES]
+
+
+def fourInARow(bits):
+	# vertical, horizontal and both diagonals; only the mover's pieces need checking,
+	# since any new line of four goes through the last move
+	for shift in (1, 7, 6, 8):
+		pairs = bits & (bits >> shift)
+		if pairs & (pairs >> (2 * shift)):
+			return True
+	return False
+
 class Game:
 
 	def __init__(self):		
@@ -11,6 +38,8 @@ class Game:
 		self.grid_shape = (6,7)
 		self.input_shape = (2,6,7)
 		self.name = 'connect4'
+		# the actions are the cells, so the cell permutations also permute the action values
+		self.symmetries = SYMMETRIES
 		self.state_size = len(self.gameState.binary)
 		self.action_size = len(self.actionSpace)
 
@@ -27,150 +56,73 @@ class Game:
 		return ((next_state, value, done, info))
 
 	def identities(self, state, actionValues):
-		identities = [(state,actionValues)]
-
-		currentBoard = state.board
-		currentAV = actionValues
-
-		currentBoard = np.array([
-			  currentBoard[6], currentBoard[5],currentBoard[4], currentBoard[3], currentBoard[2], currentBoard[1], currentBoard[0]
-			, currentBoard[13], currentBoard[12],currentBoard[11], currentBoard[10], currentBoard[9], currentBoard[8], currentBoard[7]
-			, currentBoard[20], currentBoard[19],currentBoard[18], currentBoard[17], currentBoard[16], currentBoard[15], currentBoard[14]
-			, currentBoard[27], currentBoard[26],currentBoard[25], currentBoard[24], currentBoard[23], currentBoard[22], currentBoard[21]
-			, currentBoard[34], currentBoard[33],currentBoard[32], currentBoard[31], currentBoard[30], currentBoard[29], currentBoard[28]
-			, currentBoard[41], currentBoard[40],currentBoard[39], currentBoard[38], currentBoard[37], currentBoard[36], currentBoard[35]
-			])
-
-		currentAV = np.array([
-			currentAV[6], currentAV[5],currentAV[4], currentAV[3], currentAV[2], currentAV[1], currentAV[0]
-			, currentAV[13], currentAV[12],currentAV[11], currentAV[10], currentAV[9], currentAV[8], currentAV[7]
-			, currentAV[20], currentAV[19],currentAV[18], currentAV[17], currentAV[16], currentAV[15], currentAV[14]
-			, currentAV[27], currentAV[26],currentAV[25], currentAV[24], currentAV[23], currentAV[22], currentAV[21]
-			, currentAV[34], currentAV[33],currentAV[32], currentAV[31], currentAV[30], currentAV[29], currentAV[28]
-			, currentAV[41], currentAV[40],currentAV[39], currentAV[38], currentAV[37], currentAV[36], currentAV[35]
-					])
-
-		identities.append((GameState(currentBoard, state.playerTurn), currentAV))
-
+		boards, AVs = symmetries(state.board, actionValues)
+		identities = [(state, actionValues)]
+		for board, AV in zip(boards[1:], AVs[1:]):
+			identities.append((GameState(board, state.playerTurn), AV))
 		return identities
 
 
 class GameState():
 	def __init__(self, board, playerTurn):
-		self.board = board
+		# board is the 42-cell array of 1 / -1 / 0, row by row from the top
+		board = np.asarray(board)
+		black = sum(1 << int(bit) for bit in CELL_BITS[board == 1])
+		white = sum(1 << int(bit) for bit in CELL_BITS[board == -1])
+		self._setup(black, white, playerTurn)
+
+	@classmethod
+	def fromBits(cls, black, white, playerTurn):
+		state = cls.__new__(cls)
+		state._setup(black, white, playerTurn)
+		return state
+
+	def _setup(self, black, white, playerTurn):
 		self.pieces = {'1':'X', '0': '-', '-1':'O'}
-		self.winners = [
-			[0,1,2,3],
-			[1,2,3,4],
-			[2,3,4,5],
-			[3,4,5,6],
-			[7,8,9,10],
-			[8,9,10,11],
-			[9,10,11,12],
-			[10,11,12,13],
-			[14,15,16,17],
-			[15,16,17,18],
-			[16,17,18,19],
-			[17,18,19,20],
-			[21,22,23,24],
-			[22,23,24,25],
-			[23,24,25,26],
-			[24,25,26,27],
-			[28,29,30,31],
-			[29,30,31,32],
-			[30,31,32,33],
-			[31,32,33,34],
-			[35,36,37,38],
-			[36,37,38,39],
-			[37,38,39,40],
-			[38,39,40,41],
-
-			[0,7,14,21],
-			[7,14,21,28],
-			[14,21,28,35],
-			[1,8,15,22],
-			[8,15,22,29],
-			[15,22,29,36],
-			[2,9,16,23],
-			[9,16,23,30],
-			[16,23,30,37],
-			[3,10,17,24],
-			[10,17,24,31],
-			[17,24,31,38],
-			[4,11,18,25],
-			[11,18,25,32],
-			[18,25,32,39],
-			[5,12,19,26],
-			[12,19,26,33],
-			[19,26,33,40],
-			[6,13,20,27],
-			[13,20,27,34],
-			[20,27,34,41],
-
-			[3,9,15,21],
-			[4,10,16,22],
-			[10,16,22,28],
-			[5,11,17,23],
-			[11,17,23,29],
-			[17,23,29,35],
-			[6,12,18,24],
-			[12,18,24,30],
-			[18,24,30,36],
-			[13,19,25,31],
-			[19,25,31,37],
-			[20,26,32,38],
-
-			[3,11,19,27],
-			[2,10,18,26],
-			[10,18,26,34],
-			[1,9,17,25],
-			[9,17,25,33],
-			[17,25,33,41],
-			[0,8,16,24],
-			[8,16,24,32],
-			[16,24,32,40],
-			[7,15,23,31],
-			[15,23,31,39],
-			[14,22,30,38],
-			]
 		self.playerTurn = playerTurn
-		self.binary = self._binary()
+		self.bits = {1: black, -1: white}
+		self.mask = black | white
 		self.id = self._convertStateToId()
 		self.allowedActions = self._allowedActions()
 		self.isEndGame = self._checkForEndGame()
 		self.value = self._getValue()
 		self.score = self._getScore()
 
+	@property
+	def board(self):
+		board = np.zeros(42, dtype=np.int)
+		board[(np.int64(self.bits[1]) >> CELL_BITS) & 1 == 1] = 1
+		board[(np.int64(self.bits[-1]) >> CELL_BITS) & 1 == 1] = -1
+		return board
+
+	@property
+	def binary(self):
+		currentplayer_position = (np.int64(self.bits[self.playerTurn]) >> CELL_BITS) & 1
+		other_position = (np.int64(self.bits[-self.playerTurn]) >> CELL_BITS) & 1
+		return np.append(currentplayer_position, other_position)
+
 	def _allowedActions(self):
+		# the lowest empty cell of every column that is not full
 		allowed = []
-		for i in range(len(self.board)):
-			if i >= len(self.board) - 7:
-				if self.board[i]==0:
-					allowed.append(i)
-			else:
-				if self.board[i] == 0 and self.board[i+7] != 0:
-					allowed.append(i)
-
+		for column in range(7):
+			height = ((self.mask >> (7 * column)) & 0x3F).bit_length()
+			if height < 6:
+				allowed.append(7 * (5 - height) + column)
+		allowed.sort()
 		return allowed
 
-	def _binary(self):
-
-		currentplayer_position = np.zeros(len(self.board), dtype=np.int)
-		currentplayer_position[self.board==self.playerTurn] = 1
-
-		other_position = np.zeros(len(self.board), dtype=np.int)
-		other_position[self.board==-self.playerTurn] = 1
-
-		position = np.append(currentplayer_position,other_position)
-
-		return (position)
-
 	def _convertStateToId(self):
-		player1_position = np.zeros(len(self.board), dtype=np.int)
-		player1_position[self.board==1] = 1
+		# both bitboards packed into one integer, then the side to move
+		return (((self.bits[-1] << 49) | self.bits[1]) << 1) | (self.playerTurn == 1)
 
-		other_position = np.zeros(len(self.board), dtype=np.int)
-		other_position[self.board==-1] = 1
+	def idString(self):
+		# the readable id used before integer ids, for logging
+		board = self.board
+		player1_position = np.zeros(len(board), dtype=np.int)
+		player1_position[board==1] = 1
+
+		other_position = np.zeros(len(board), dtype=np.int)
+		other_position[board==-1] = 1
 
 		position = np.append(player1_position,other_position)
 
@@ -178,22 +130,23 @@ class GameState():
 
 		return id
 
+	def positionKey(self):
+		# the two bitboards, plus the side to move
+		return (self.playerTurn, self.bits[1], self.bits[-1])
+
 	def _checkForEndGame(self):
-		if np.count_nonzero(self.board) == 42:
+		if self.mask == FULL_BOARD:
+			return 1
+		if fourInARow(self.bits[-self.playerTurn]):
 			return 1
-
-		for x,y,z,a in self.winners:
-			if (self.board[x] + self.board[y] + self.board[z] + self.board[a] == 4 * -self.playerTurn):
-				return 1
 		return 0
 
 
 	def _getValue(self):
 		# This is the value of the state for the current player
 		# i.e. if the previous player played a winning move, you lose
-		for x,y,z,a in self.winners:
-			if (self.board[x] + self.board[y] + self.board[z] + self.board[a] == 4 * -self.playerTurn):
-				return (-1, -1, 1)
+		if fourInARow(self.bits[-self.playerTurn]):
+			return (-1, -1, 1)
 		return (0, 0, 0)
 
 
@@ -205,10 +158,10 @@ class GameState():
 
 
 	def takeAction(self, action):
-		newBoard = np.array(self.board)
-		newBoard[action]=self.playerTurn
-		
-		newState = GameState(newBoard, -self.playerTurn)
+		bits = dict(self.bits)
+		bits[self.playerTurn] |= 1 << int(CELL_BITS[action])
+
+		newState = GameState.fromBits(bits[1], bits[-1], -self.playerTurn)
 
 		value = 0
 		done = 0
@@ -222,9 +175,7 @@ class GameState():
 
 
 	def render(self, logger):
+		board = self.board
 		for r in range(6):
-			logger.info([self.pieces[str(x)] for x in self.board[7*r : (7*r + 7)]])
+			logger.info([self.pieces[str(x)] for x in board[7*r : (7*r + 7)]])
 		logger.info('--------------')
-
-
-
@@ -0,0 +1,347 @@
+from collections import deque
+
+import numpy as np
+
+from go_points import iter_points, popcount, state_id
+from history import HistoryPlanes
+from zobrist import Zobrist
+
+
+class BoardMasks(object):
+    """ Masks for one board size, built once and shared by every BitBoard of that size """
+
+    _cache = {}
+
+    def __init__(self, board_size):
+        self.board_size = board_size
+        self.area = board_size ** 2
+        self.full = (1 << self.area) - 1
+
+        left = 0
+        right = 0
+        for x in range(board_size):
+            left |= 1 << (x * board_size)
+            right |= 1 << (x * board_size + board_size - 1)
+        self.not_left = self.full & ~left
+        self.not_right = self.full & ~right
+
+        self.neighbors = [self.dilate(1 << point) for point in range(self.area)]
+
+    @classmethod
+    def get(cls, board_size):
+        if board_size not in cls._cache:
+            cls._cache[board_size] = BoardMasks(board_size)
+        return cls._cache[board_size]
+
+    def dilate(self, bits):
+        """ Every point orthogonally adjacent to a point in bits """
+        n = self.board_size
+        return (((bits << 1) & self.not_left)
+                | ((bits >> 1) & self.not_right)
+                | (bits << n)
+                | (bits >> n)) & self.full
+
+    def group(self, seed, stones):
+        """ The chain of stones connected to the seed point(s) """
+        group = seed
+        while True:
+            grown = (group | self.dilate(group)) & stones
+            if grown == group:
+                return group
+            group = grown
+
+    def plane(self, bits):
+        data = bits.to_bytes((self.area + 7) // 8, 'little')
+        # unpackbits gives each byte's bits most significant first; reversing
+        # them within the byte puts bit i at index i (no bitorder before NumPy 1.17)
+        plane = np.unpackbits(np.frombuffer(data, dtype=np.uint8)).reshape(-1, 8)[:, ::-1].ravel()[:self.area]
+        return plane.reshape(self.board_size, self.board_size).astype(np.int)
+
+    def string(self, bits):
+        return format(bits, '0{}b'.format(self.area))[::-1]
+
+
+class BitBoard(object):
+    """
+    Go board that holds each player's stones as one integer bitmask.
+
+    Point (x, y) is bit x * board_size + y, the same flat index as the action
+    space. Chains, liberties and captures come from shifts and masks rather
+    than Position objects and union-find. It has the same interface as
+    go_board.Board, so game.Game can use either one (config.GO_ENGINE).
+    """
+
+    def __init__(self, board_size, state=None, playerTurn=None):
+        if not playerTurn:
+            raise NotImplementedError
+        self.pieces = {'1': 'X', '0': '-', '-1': 'O'}
+        self.playerTurn = playerTurn
+        self.board_size = board_size
+        self.PASS_INDEX = self.board_size ** 2
+        self.masks = BoardMasks.get(self.board_size)
+        self.stones = {1: 0, -1: 0}
+        self.zhash = 0
+        self.repeats = 0
+        self.z_table = set()
+        self.zobrist = Zobrist.shared(self.board_size)
+        self.action_space = np.zeros(self.PASS_INDEX + 1, dtype=np.int)
+        self.captures = {1: 0, -1: 0}
+        self.passes = {1: False, -1: False}
+        self.history = HistoryPlanes(self.board_size)
+        self.zhash_history = deque([], maxlen=7)
+
+        self._initialize_history()
+
+        self.allowedActions = self._allowedActions()
+        self.id = self._convertStateToId()
+        self.isEndGame = self._checkForEndGame()
+        self.value = self._getValue()
+        self.score = self._getScore()
+        self.newState = None
+
+    @property
+    def binary(self):
+        current = self.masks.plane(self.stones[self.playerTurn]).flatten()
+        other = self.masks.plane(self.stones[-self.playerTurn]).flatten()
+        return np.append(current, other)
+
+    def switch_player(self):
+        self.playerTurn = self.playerTurn * -1
+
+    def _initialize_history(self):
+        for i in range(7):
+            self.zhash_history.append(0)
+
+    def player_as_layer(self):
+        return np.full((self.board_size, self.board_size), self.playerTurn, dtype=np.int)
+
+    def _checkForEndGame(self):
+        if self.passes[1] and self.passes[-1]:
+            return 1
+        return 0
+
+    def _getValue(self):
+        # This is the value of the state for the current player
+        # i.e. if the previous player played a winning move, you lose
+        if self.passes[1] and self.passes[-1]:
+            score = self._score()
+            if score == -1 * self.playerTurn:
+                return (-1, -1, 1)
+            else:
+                return (-1, 1, -1)
+        return (0, 0, 0)
+
+    def _getScore(self):
+        tmp = self.value
+        return (tmp[1], tmp[2])
+
+    def _convertStateToId(self):
+        return state_id(self.zhash, self.repeats, self.passes, self.playerTurn)
+
+    def idString(self):
+        """ The readable id that Board used before integer ids, for logging """
+        passes = ('1' if self.passes[self.playerTurn] else '0') + ('1' if self.passes[-1 * self.playerTurn] else '0')
+        _id = self.masks.string(self.stones[-1 * self.playerTurn]) + passes + self.masks.string(self.stones[self.playerTurn]) + passes
+        _id += '-' + '-'.join(map(str, self.allowedActions))
+        return _id
+
+    def dump_state_example(self, out=None):
+        return self.history.model_input(self.playerTurn, out)
+
+    def update_history(self):
+        self.history.push(self.masks.plane(self.stones[1]), self.masks.plane(self.stones[-1]))
+        self.zhash_history.append(self.zhash)
+
+    def positionKey(self):
+        """ The model input is the last 7 positions plus the side to move """
+        return (self.playerTurn,) + tuple(self.zhash_history)
+
+    def _zobrist(self, bits, player):
+        zhash = 0
+        for point in iter_points(bits):
+            zhash ^= self.zobrist.key(point, player)
+        return zhash
+
+    def imagine(self, point, player, superko=True):
+        """
+        The outcome of player playing at point.
+
+        Returns None for an occupied point, suicide or (unless superko is
+        False) a superko repeat, otherwise (own stones, opposing stones,
+        captured stones, zobrist hash) after the move.
+        """
+        masks = self.masks
+        bit = 1 << point
+        own = self.stones[player]
+        opp = self.stones[-player]
+        if (own | opp) & bit:
+            return None
+        own |= bit
+        empty = masks.full & ~(own | opp)
+
+        captured = 0
+        for neighbor in iter_points(masks.neighbors[point] & opp):
+            if captured >> neighbor & 1:
+                continue
+            group = masks.group(1 << neighbor, opp)
+            if not masks.dilate(group) & empty:
+                captured |= group
+
+        zhash = self.zhash ^ self.zobrist.key(point, player)
+        if captured:
+            opp &= ~captured
+            zhash ^= self._zobrist(captured, -player)
+        elif not masks.neighbors[point] & empty:
+            if not masks.dilate(masks.group(bit, own)) & empty:
+                return None
+
+        if superko and zhash in self.z_table:
+            return None
+        return own, opp, captured, zhash
+
+    def _allowedActions(self):
+        empty = self.masks.full & ~(self.stones[1] | self.stones[-1])
+        legal = []
+        self.repeats = 0
+        for point in iter_points(empty):
+            rv = self.imagine(point, self.playerTurn, superko=False)
+            if rv is None:
+                continue
+            if rv[3] in self.z_table:
+                self.repeats |= 1 << point
+                continue
+            legal.append(point)
+        legal.append(self.PASS_INDEX)
+        return np.array(legal)
+
+    def act(self, loc):
+        result = {'valid': True,
+                  'captures': {1: 0, -1: 0}}
+        rv = self.imagine(int(loc[0] * self.board_size + loc[1]), self.playerTurn)
+        if rv is None:
+            result['valid'] = False
+        else:
+            own, opp, captured, zhash = rv
+            self.stones[self.playerTurn] = own
+            self.stones[-self.playerTurn] = opp
+            self.zhash = zhash
+            result['captures'][self.playerTurn] = popcount(captured)
+            self.captures[self.playerTurn] += result['captures'][self.playerTurn]
+            self.z_table.add(zhash)
+
+        self.passes = {1: False, -1: False}
+        self.update_history()
+        self.switch_player()
+        self.allowedActions = self._allowedActions()
+        self.id = self._convertStateToId()
+        return result
+
+    def take_action(self, loc):
+        """ Wrapper for act for DRL to use """
+        done = 0
+        value = 0
+        self.act(loc)
+        return value, done
+
+    def player_pass(self):
+        done = 0
+        value = 0
+        self.update_history()
+        self.passes[self.playerTurn] = True
+        self.switch_player()
+        legal = self._allowedActions()
+        if self.passes[-1] and self.passes[1]:
+            winner = self._score()
+            if winner == -1 * self.playerTurn:
+                value = 1
+            else:
+                value = -1
+            done = 1
+            allowed_actions = []
+        else:
+            allowed_actions = legal
+        self.value = self._getValue()
+        self.score = self._getScore()
+        self.allowedActions = allowed_actions
+        self.id = self._convertStateToId()
+
+        return value, done
+
+    def copy(self):
+        new = BitBoard.__new__(BitBoard)
+        new.__dict__.update(self.__dict__)
+        new.stones = dict(self.stones)
+        new.z_table = set(self.z_table)
+        new.captures = dict(self.captures)
+        new.passes = dict(self.passes)
+        new.history = self.history.copy()
+        new.zhash_history = deque(self.zhash_history, maxlen=7)
+        new.newState = None
+        return new
+
+    def takeAction(self, flat_array_index):
+        self.newState = self.copy()
+        if flat_array_index != self.PASS_INDEX:
+            loc = (flat_array_index // self.board_size, flat_array_index % self.board_size)
+            value, done = self.newState.take_action(loc)
+        else:
+            value, done = self.newState.player_pass()
+
+        if self.newState._checkForEndGame() == 1:
+            self.newState.value = self.newState._getValue()
+            self.newState.score = self.newState._getScore()
+            winner = self.newState._score()
+            if winner == self.newState.playerTurn:
+                value = 1
+            else:
+                value = -1
+            done = 1
+
+        return self.newState, value, done
+
+    def territory(self):
+        """ Empty points in regions bordered by only one colour, per player """
+        masks = self.masks
+        black = self.stones[1]
+        white = self.stones[-1]
+        empty = masks.full & ~(black | white)
+        rv = {1: 0, -1: 0}
+        remaining = empty
+        while remaining:
+            region = masks.group(remaining & -remaining, empty)
+            remaining &= ~region
+            border = masks.dilate(region)
+            if border & black and not border & white:
+                rv[1] += popcount(region)
+            elif border & white and not border & black:
+                rv[-1] += popcount(region)
+        return rv
+
+    def _score(self):
+        """ 1 if black holds more territory than white, else -1 """
+        territory = self.territory()
+        if territory[1] > territory[-1]:
+            return 1
+        return -1
+
+    def to_ascii(self):
+        black = self.masks.string(self.stones[1])
+        white = self.masks.string(self.stones[-1])
+        board = ''
+        for x in range(self.board_size):
+            r = ''
+            for y in range(self.board_size):
+                point = x * self.board_size + y
+                if black[point] == '1':
+                    r += 'x '
+                elif white[point] == '1':
+                    r += 'o '
+                else:
+                    r += '. '
+            r += '\n'
+            board += r
+        return board
+
+    def render(self, logger):
+        logger.info(self.to_ascii())
+        logger.info('--------------')
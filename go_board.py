@@ -1,11 +1,47 @@
-import pickle
 from collections import deque
 
 import numpy as np
 
+from go_points import iter_points, state_id
+from history import HistoryPlanes
 from zobrist import Zobrist
 
 
+def label_regions(mask):
+    """
+    Label the connected regions of the True points of a 2-D boolean array.
+
+    Every point starts with its flat index and takes the smallest label
+    among itself and its neighbours in the mask, then the label of the
+    point its label names, until nothing changes. Each region ends up
+    labelled with its smallest index; points outside the mask are
+    labelled mask.size.
+    """
+    outside = mask.size
+    labels = np.where(mask, np.arange(mask.size).reshape(mask.shape), outside)
+    while True:
+        spread = labels.copy()
+        np.minimum(spread[1:], labels[:-1], out=spread[1:])
+        np.minimum(spread[:-1], labels[1:], out=spread[:-1])
+        np.minimum(spread[:, 1:], labels[:, :-1], out=spread[:, 1:])
+        np.minimum(spread[:, :-1], labels[:, 1:], out=spread[:, :-1])
+        spread[~mask] = outside
+        spread = np.append(spread, outside)[spread]
+        if (spread == labels).all():
+            return labels
+        labels = spread
+
+
+def touching(stones):
+    """ The points orthogonally next to a True point of a 2-D boolean array """
+    rv = np.zeros_like(stones)
+    rv[1:] |= stones[:-1]
+    rv[:-1] |= stones[1:]
+    rv[:, 1:] |= stones[:, :-1]
+    rv[:, :-1] |= stones[:, 1:]
+    return rv
+
+
 class Board(object):
 
     def __init__(self, board_size, state=None, playerTurn=None):
@@ -15,32 +51,31 @@ class Board(object):
         self.playerTurn = playerTurn
         self.board_size = board_size
         self.PASS_INDEX = self.board_size ** 2
-        self.dragons = {}
+        self.zhash = 0
+        self.repeats = 0
         self.z_table = set()
-        self.zobrist = Zobrist(self.board_size)
+        self.z_counts = set()
+        self.stones = 0
+        self.zobrist = Zobrist.shared(self.board_size)
         self.positions = [[Position(x, y, self.board_size) for y in range(self.board_size)] for x in range(self.board_size)]
+        self.groups = StoneGroups(self.board_size)
+        self.legal = {1: set(range(self.PASS_INDEX)), -1: set(range(self.PASS_INDEX))}
         self.action_space = self.set_action_space()
         self.captures = {1: 0, -1: 0}
         self.passes = {1: False, -1: False}
-        self.history = deque([], maxlen=14)
+        self.history = HistoryPlanes(self.board_size)
         self.zhash_history = deque([], maxlen=7)
 
         self._initialize_history()
 
         self.binary = self._binary()
+        self.allowedActions = self._allowedActions()
         self.id = self._convertStateToId()
-        self.allowedActions = self._allowedActions() 
         self.isEndGame = self._checkForEndGame()
         self.value = self._getValue()
         self.score = self._getScore()
         self.newState = None
 
-    @property
-    def next_dragon(self):
-        if not self.dragons:
-            return 1
-        return max(self.dragons.keys()) + 1
-
     def set_action_space(self):
         rv = [0 for y in range(self.board_size) for x in range(self.board_size)]
         rv.append(0)  # for pass
@@ -50,10 +85,8 @@ class Board(object):
         self.playerTurn = self.playerTurn * -1
 
     def _initialize_history(self):
-        
-        state = np.array([np.zeros(self.board_size, dtype=np.int) for z in range(self.board_size)])
-        for i in range(14):
-            self.history.append(state)
+        for i in range(7):
+            self.zhash_history.append(0)
 
     def player_as_layer(self):
         player_layer = np.array([np.ones(self.board_size, dtype=np.int) for z in range(self.board_size)])
@@ -69,7 +102,7 @@ class Board(object):
         # This is the value of the state for the current player
         # i.e. if the previous player played a winning move, you lose
         score = 0
-        if np.array(self.passes).all():
+        if self.passes[1] and self.passes[-1]:
             score = self._score()
             if score == -1 * self.playerTurn:
                 return (-1, -1, 1)
@@ -99,6 +132,10 @@ class Board(object):
         return position
 
     def _convertStateToId(self):
+        return state_id(self.zhash, self.repeats, self.passes, self.playerTurn)
+
+    def idString(self):
+        """ The readable id that Board used before integer ids, for logging """
         currentplayer_position = np.array([np.zeros(self.board_size, dtype=np.int) for z in range(self.board_size)])
         other_position = np.array([np.zeros(self.board_size, dtype=np.int) for z in range(self.board_size)])
         for x, row in enumerate(self.positions):
@@ -127,28 +164,22 @@ class Board(object):
 
         _id = ''.join(map(str, position))
 
-        str_actions = '-'.join(map(str, self._allowedActions()))
+        str_actions = '-'.join(map(str, self.allowedActions))
         _id += '-' + str_actions
 
         return _id
 
-    def dump_state_example(self):
-        history = list(self.history)
-        history.append(self.player_as_layer())
-        return np.stack(history)
+    def dump_state_example(self, out=None):
+        return self.history.model_input(self.playerTurn, out)
 
     def update_history(self):
-        player_one_state =  np.array([np.zeros(self.board_size, dtype=np.int) for z in range(self.board_size)])
-        player_neg_one_state = np.array([np.zeros(self.board_size, dtype=np.int) for z in range(self.board_size)]) 
-        for idx, row in enumerate(self.positions):
-            for idy, pos in enumerate(row):
-                if pos.player == 1:
-                    player_one_state[idx][idy] = 1
-                elif pos.player == -1:
-                    player_neg_one_state[idx][idy] = 1
+        board = np.array(self.groups.color, dtype=np.int8).reshape(self.board_size, self.board_size)
+        self.history.push(board == 1, board == -1)
+        self.zhash_history.append(self.zhash)
 
-        self.history.append(player_one_state)
-        self.history.append(player_neg_one_state)
+    def positionKey(self):
+        """ The model input is the last 7 positions plus the side to move """
+        return (self.playerTurn,) + tuple(self.zhash_history)
 
     def act(self, loc):
         result = {'valid': True,
@@ -158,29 +189,22 @@ class Board(object):
         if rv['occupied'] or rv['suicide'] or rv['repeat']:
             result['valid'] = False
         else:
-            friendly_dragons = list(rv['stitched'])
-            touched_dragons = set()
+            point = pos.x * self.board_size + pos.y
+            captured = self.groups.place(point, self.playerTurn)
             pos.occupy(self.playerTurn)
-            if not friendly_dragons:
-                dragon_id = self.create_new_dragon()
-                self.dragons[dragon_id].add_member(pos)
-                touched_dragons.add(self.dragons[dragon_id])
-            else:
-                base_dragon = friendly_dragons[0]
-                base_dragon.add_member(pos)
-                for dragon in friendly_dragons[1:]:
-                    self.stitch_dragons(base_dragon.identifier, dragon.identifier)
-                touched_dragons.add(base_dragon)
-            if rv['captured']:
-                for dragon in rv['captured']:
-                    result['captures'][self.playerTurn] += self.capture_dragon(dragon.identifier)
-
-            touched_dragons.update(rv['opp_neighbor'])
-            for dragon in touched_dragons:
-                dragon.update()
+            for capture in captured:
+                capture_pos = self.pos_by_location(divmod(capture, self.board_size))
+                capture_pos.player = 0
+            result['captures'][self.playerTurn] = len(captured)
+            self.captures[self.playerTurn] += len(captured)
+
+            self.stones += 1 - len(captured)
+            self.zhash = rv['zhash']
+            self.z_table.add(rv['zhash'])
+            self.z_counts.add(self.stones)
+            self.update_legal([point] + captured)
 
         self.passes = {1: False, -1: False}
-        self.z_table.add(rv['zhash'])
         self.update_history()
         self.switch_player()
         self.allowedActions = self._allowedActions()
@@ -200,6 +224,7 @@ class Board(object):
         self.update_history()
         self.passes[self.playerTurn] = True
         self.switch_player()
+        legal = self._allowedActions()
         if self.passes[-1] and self.passes[1]:
             winner = self._score()
             if winner == -1 * self.playerTurn:
@@ -209,7 +234,7 @@ class Board(object):
             done = 1
             allowed_actions = []
         else:
-            allowed_actions = self._allowedActions()
+            allowed_actions = legal
         self.value = self._getValue()
         self.score = self._getScore()
         self.allowedActions = allowed_actions
@@ -217,8 +242,30 @@ class Board(object):
 
         return value, done
 
+    def copy(self):
+        """
+        Structural copy of the board for takeAction.
+
+        Positions, the history planes and the mutable bookkeeping
+        are rebuilt; the Zobrist table and the neighbour sets are never
+        mutated, so they are shared with the original.
+        """
+        new = Board.__new__(Board)
+        new.__dict__.update(self.__dict__)
+        new.positions = [[pos.copy() for pos in row] for row in self.positions]
+        new.z_table = set(self.z_table)
+        new.z_counts = set(self.z_counts)
+        new.groups = self.groups.copy()
+        new.legal = {1: set(self.legal[1]), -1: set(self.legal[-1])}
+        new.captures = dict(self.captures)
+        new.passes = dict(self.passes)
+        new.history = self.history.copy()
+        new.zhash_history = deque(self.zhash_history, maxlen=7)
+        new.newState = None
+        return new
+
     def takeAction(self, flat_array_index):
-        self.newState = pickle.loads(pickle.dumps(self))
+        self.newState = self.copy()
         if flat_array_index != self.PASS_INDEX:
             loc = (flat_array_index // self.board_size, flat_array_index % self.board_size)
             value, done = self.newState.take_action(loc)
@@ -237,47 +284,97 @@ class Board(object):
 
         return self.newState, value, done 
 
-    def add_up_score(self, player, dragons):
-        for d in dragons:
-            self.captures[player] += len(d.members)
+    def territory(self):
+        """ Empty points in regions bordered by only one colour, per player """
+        board = np.array(self.groups.color).reshape(self.board_size, self.board_size)
+        empty = board == 0
+        labels = label_regions(empty)[empty]
+        sizes = np.bincount(labels, minlength=board.size)
+        touches = {}
+        for player in (1, -1):
+            near = touching(board == player)[empty]
+            touches[player] = np.bincount(labels, weights=near, minlength=board.size) > 0
+        return {1: int(sizes[touches[1] & ~touches[-1]].sum()),
+                -1: int(sizes[touches[-1] & ~touches[1]].sum())}
 
     def _score(self):
-        rv = self.set_empty_dragons()
-        for x in [-1, 1]:
-            self.add_up_score(x, rv[x])
-        caps = [self.captures[-1], -100000, self.captures[1]]
-        if caps[0] == caps[2]:
-            return -1
-        return caps.index(max(caps)) - 1  # Okay this is embarassing hack.  sorry
-
-    def allowed_plays(self, for_player):
-        allowed = []
-        open_pos = []
-
-        for row in self.positions:
-            for pos in row:
-                if not pos.is_occupied:
-                    open_pos.append(pos)
-        for pos in open_pos:
-            rv = self.imagine_position(pos, for_player)
-            if rv['suicide'] or rv['repeat']:
-                continue
-            allowed.append(pos.loc)
-        return allowed
+        """ 1 if black holds more territory than white, else -1 """
+        territory = self.territory()
+        if territory[1] > territory[-1]:
+            return 1
+        return -1
 
     def _allowedActions(self):
-        legal = [(x * self.board_size) + y for x, y in self.allowed_plays(self.playerTurn)]
+        player = self.playerTurn
+        if self.stones + 1 in self.z_counts:
+            # a plain placement could recreate an earlier position
+            suspects = self.legal[player]
+        else:
+            # only a capture can bring the stone count back to an earlier one
+            suspects = set()
+            groups = self.groups
+            for root in groups.roots(-player):
+                liberties = groups.libs[root]
+                if not liberties & (liberties - 1):
+                    suspects.add(liberties.bit_length() - 1)
+        legal = []
+        self.repeats = 0
+        for point in sorted(self.legal[player]):
+            if point in suspects and self.imagine_position(self.pos_by_location(divmod(point, self.board_size)), player)['repeat']:
+                self.repeats |= 1 << point
+                continue
+            legal.append(point)
         legal.append(self.PASS_INDEX)
         return np.array(legal)
 
-    def imagine_zobrist(self, pos, captures, player):
-        board = self.fake_board(pos, captures, player)
-        return self.zobrist.get_hash(board, fake=True)
+    def update_legal(self, changed):
+        """
+        Refresh self.legal after a placement.
 
-    def create_new_dragon(self):
-        dragon_id = self.next_dragon
-        self.dragons[dragon_id] = Dragon(dragon_id, self)
-        return dragon_id
+        changed holds the new stone and the captured stones. Only those
+        points, their neighbours and the liberties of the chains next to
+        them can have changed legality.
+        """
+        groups = self.groups
+        points = set(changed)
+        liberties = 0
+        for point in changed:
+            for neighbor in groups.neighbors[point]:
+                points.add(neighbor)
+                if groups.color[neighbor]:
+                    liberties |= groups.libs[groups.find(neighbor)]
+        points.update(iter_points(liberties))
+        for point in points:
+            for player in (1, -1):
+                if self.is_legal(point, player):
+                    self.legal[player].add(point)
+                else:
+                    self.legal[player].discard(point)
+
+    def is_legal(self, point, player):
+        """ Whether player may play at point, leaving superko aside """
+        groups = self.groups
+        color = groups.color
+        if color[point]:
+            return False
+        neighbors = groups.neighbors[point]
+        for neighbor in neighbors:
+            if not color[neighbor]:
+                return True
+        bit = 1 << point
+        for neighbor in neighbors:
+            last = groups.libs[groups.find(neighbor)] == bit
+            if (color[neighbor] == player) != last:
+                return True
+        return False
+
+    def imagine_zobrist(self, pos, captures, player):
+        """ The hash after player plays at pos, updated from self.zhash by XOR """
+        zhash = self.zhash ^ self.zobrist.key(pos.x * self.board_size + pos.y, player)
+        for root in captures:
+            for capture in self.groups.stones(root):
+                zhash ^= self.zobrist.key(capture, -player)
+        return zhash
 
     def pos_by_location(self, tup):
         '''
@@ -296,55 +393,6 @@ class Board(object):
         return self.positions[tup[0]][tup[1]]
         # return self.positions[x][y]
 
-    def stitch_dragons(self, d1_id, d2_id):
-        """
-        Stitch two dragons into one.
-        Args:
-            d1, d2  2 keys to the dragon dictionary
-
-        Return:
-            Dragon instance
-        """
-        d1 = self.dragons[d1_id]
-        d2 = self.dragons[d2_id]
-
-        if not d1.neighbors.intersection(d2.members):
-            raise NotImplementedError('Cannot merge unconnected dragons.')
-        for member in d2.members:
-            d1.add_member(member, force=True)
-        del self.dragons[d2_id]
-        del d2
-        return d1
-
-    def get_neighboring_dragons(self, pos, player):
-        neighbors = [self.pos_by_location(x) for x in pos.neighbors_locs]
-        rv = set()
-        for x in neighbors:
-            if x.dragon and x.player == player:
-                rv.add(self.dragons[x.dragon])
-        return rv
-
-    def get_opposing_player(self, player):
-        if not player:
-            return 0
-        elif player == 1:
-            return -1
-        return 1
-
-    def fake_board(self, pos, captures, player):
-        fake = []
-        for row in self.positions:
-            fake_row = []
-            for point in row:
-                fake_row.append(point.player)
-            fake.append(fake_row)
-        fake[pos.x][pos.y] = player
-
-        for captured_dragon in captures:
-            for capture in captured_dragon.members:
-                fake[capture.x][capture.y] = 0
-        return fake
-
     def imagine_position(self, pos, player):
         """
         For a given position instance, imagine the outcome playing there.
@@ -354,8 +402,8 @@ class Board(object):
             player str: 1 or -1
         Returns:
             dict  {'suicide': bool,
-                   'captured': list of dragon instances,
-                   'stitched': list of dragon instances}
+                   'captured': set of roots of the captured chains,
+                   'stitched': set of roots of the chains joined}
         """
         rv = {'suicide': False,
               'occupied': False,
@@ -368,114 +416,35 @@ class Board(object):
             rv['occupied'] = True
             return rv
 
-        opposing_dragons = self.get_neighboring_dragons(pos, self.get_opposing_player(player))
-        self_dragons = self.get_neighboring_dragons(pos, player)
-        neighbors = [self.pos_by_location(x) for x in pos.neighbors_locs]
-        liberties = [x for x in neighbors if not x.is_occupied]
-
-        for opp_dragon in opposing_dragons:
-            if opp_dragon.liberties == {pos}:
-                rv['captured'].add(opp_dragon)
+        groups = self.groups
+        point = pos.x * self.board_size + pos.y
+        bit = 1 << point
+        liberties = False
+        stitched_valid = False
+        for neighbor in groups.neighbors[point]:
+            color = groups.color[neighbor]
+            if not color:
+                liberties = True
+                continue
+            root = groups.find(neighbor)
+            if color == player:
+                rv['stitched'].add(root)
+                if groups.libs[root] != bit:
+                    stitched_valid = True
+            elif groups.libs[root] == bit:
+                rv['captured'].add(root)
             else:
-                rv['opp_neighbor'].add(opp_dragon)
-
-        check_for_suicide = self.imagine_stitched_valid(pos, self_dragons)
+                rv['opp_neighbor'].add(root)
 
-        if liberties or check_for_suicide:
-            rv['stitched'] = self_dragons
-        elif not liberties and not rv['captured']:
+        if not (liberties or stitched_valid or rv['captured']):
             rv['suicide'] = True
+            rv['stitched'] = set()
 
         rv['zhash'] = self.imagine_zobrist(pos, rv['captured'], player)
         if rv['zhash'] in self.z_table:
             rv['repeat'] = True
         return rv
 
-    def imagine_stitched_valid(self, pos, dragons):
-        """
-        Checks to see if the current position is the last liberty of all associated dragons
-        """
-        if not dragons:
-            return False
-        liberties = set()
-        for dragon in dragons:
-            liberties.update(dragon.liberties)
-        if liberties == {pos}:
-            return False
-        return True
-
-    def capture_dragon(self, dragon_id):
-        d = self.dragons[dragon_id]
-        captures = len(d.members)
-        opposing_dragons = set()
-        for pos in d.members:
-            opposing_dragons.update(self.get_neighboring_dragons(pos, self.get_opposing_player(d.player)))
-
-            pos.player = 0
-            pos.dragon = None
-        for dragon in opposing_dragons:
-            dragon.update()
-        del self.dragons[dragon_id]
-        del d
-        return captures
-
-    def set_empty_dragons(self):
-
-        rv = {'all_dragons': set(),
-              1: set(),
-              -1: set()}
-        empty = []
-        for x in range(self.board_size):
-            for y in range(self.board_size):
-                if not self.positions[x][y].is_occupied:
-                    empty.append(self.positions[x][y])
-        for pos1 in empty:
-            if not pos1.dragon:
-                n_dragons = list(self.get_neighboring_dragons(pos1, 0))
-                if n_dragons:
-                    d1 = n_dragons[0]
-                    d1.add_member(pos1)
-                    rv['all_dragons'].add(d1.identifier)
-                    for d in n_dragons[1:]:
-                        other_id = d.identifier
-                        self.stitch_dragons(d1.identifier, other_id)
-                        rv['all_dragons'].discard(other_id)
-                    dragon = d1
-                else:
-                    dragon_id = self.create_new_dragon()
-                    dragon = self.dragons[dragon_id]
-                    rv['all_dragons'].add(dragon.identifier)
-                    dragon.add_member(pos1)
-            else:
-                try:
-                    dragon = self.dragons[pos1.dragon]
-                except KeyError:
-                    print(self.dragons)
-                    print(pos1.dragon)
-                    print(pos1)
-                    print(self.to_ascii())
-                    raise NotImplementedError
-            for pos2 in empty:
-                if pos1 == pos2:
-                    continue
-                if pos2 in dragon.neighbors:
-                    dragon.add_member(pos2)
-
-        for d_id in rv['all_dragons']:
-            try:
-                d = self.dragons[d_id]
-            except KeyError:
-                print(rv['all_dragons'])
-                print(d_id)
-                print(self.to_ascii())
-                raise NotImplementedError
-            surr_color = set()
-            for x in d.neighbors:
-                surr_color.add(x.player)
-            if len(surr_color) == 1:
-                rv[list(surr_color)[0]].add(d)
-        return rv
-
     def to_ascii(self):
         board = ''
         for row in self.positions:
@@ -517,7 +486,6 @@ class Position(object):
         self.y = y
         self.board_size = board_size
 
-        self.dragon = None
         self.player = 0
         self.neighbors_locs = self.init_neighbors()
 
@@ -543,6 +511,11 @@ class Position(object):
     def occupy(self, player):
         self.player = player
 
+    def copy(self):
+        new = Position.__new__(Position)
+        new.__dict__.update(self.__dict__)
+        return new
+
     def init_neighbors(self):
 
         neighbors = []
@@ -553,34 +526,106 @@ class Position(object):
         return set([(x, y) for x, y in neighbors])
 
 
-class Dragon(object):
-
-    def __init__(self, identifier, board):
-
-        self.identifier = identifier
-        self.player = 0
-        self.board = board
-        self.members = set()
-        self.neighbors = set()
-        self.liberties = set()
-
-    def is_member(self, pos):
-        return pos in self.members
-
-    def update(self):
-        self.liberties = set([x for x in self.neighbors if not x.is_occupied])
-
-    def add_member(self, pos, force=False):
-        if self.player and self.player != pos.player:
-            raise NotImplementedError('Wrong player to connect to this dragon.')
-
-        if not force and self.members and not (pos in self.neighbors or pos in self.members):
-            raise NotImplementedError('Cannot connect to this dragon.')
+class StoneGroups(object):
+    """
+    Chains of stones as a union-find over the flat points of the board.
+
+    find(point) gives the root of a stone's chain, and the root keeps the
+    chain's liberties as a bitmask in libs, so joining chains is an OR and
+    a chain is captured when its mask runs out. next_stone links the
+    stones of each chain in a ring, so a captured chain can be walked
+    without keeping a member set.
+    """
+
+    _neighbors = {}
+
+    def __init__(self, board_size):
+        area = board_size ** 2
+        if board_size not in StoneGroups._neighbors:
+            StoneGroups._neighbors[board_size] = [[x * board_size + y for x, y in sorted(Position(p // board_size, p % board_size, board_size).neighbors_locs)] for p in range(area)]
+        self.neighbors = StoneGroups._neighbors[board_size]
+        self.color = [0] * area
+        self.parent = list(range(area))
+        self.size = [1] * area
+        self.libs = [0] * area
+        self.next_stone = list(range(area))
+
+    def copy(self):
+        new = StoneGroups.__new__(StoneGroups)
+        new.neighbors = self.neighbors
+        new.color = list(self.color)
+        new.parent = list(self.parent)
+        new.size = list(self.size)
+        new.libs = list(self.libs)
+        new.next_stone = list(self.next_stone)
+        return new
+
+    def find(self, point):
+        parent = self.parent
+        while parent[point] != point:
+            parent[point] = parent[parent[point]]
+            point = parent[point]
+        return point
+
+    def roots(self, player):
+        return [p for p, c in enumerate(self.color) if c == player and self.parent[p] == p]
+
+    def stones(self, root):
+        point = root
+        while True:
+            yield point
+            point = self.next_stone[point]
+            if point == root:
+                return
+
+    def union(self, a, b):
+        """ Join the chains rooted at a and b and return the new root """
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.libs[a] |= self.libs[b]
+        self.next_stone[a], self.next_stone[b] = self.next_stone[b], self.next_stone[a]
+        return a
+
+    def place(self, point, player):
+        """ Put player's stone on the empty point and return the points it captures """
+        color = self.color
+        libs = self.libs
+        bit = 1 << point
+        color[point] = player
+        libs[point] = 0
+        root = point
+        captured = []
+        for neighbor in self.neighbors[point]:
+            if not color[neighbor]:
+                libs[root] |= 1 << neighbor
+            elif color[neighbor] == player:
+                other = self.find(neighbor)
+                if other != root:
+                    libs[other] &= ~bit
+                    root = self.union(root, other)
+            else:
+                other = self.find(neighbor)
+                libs[other] &= ~bit
+                if not libs[other]:
+                    captured.extend(self.remove(other))
+        return captured
+
+    def remove(self, root):
+        """ Take the chain off the board, giving its points back as liberties """
+        stones = list(self.stones(root))
+        for point in stones:
+            self.color[point] = 0
+        for point in stones:
+            bit = 1 << point
+            for neighbor in self.neighbors[point]:
+                if self.color[neighbor]:
+                    self.libs[self.find(neighbor)] |= bit
+        for point in stones:
+            self.parent[point] = point
+            self.size[point] = 1
+            self.libs[point] = 0
+            self.next_stone[point] = point
+        return stones
 
-        if not self.player:
-            self.player = pos.player
-        pos.dragon = self.identifier
-        self.members.add(pos)
-        self.neighbors.update(set([self.board.pos_by_location(x) for x in pos.neighbors_locs]))
-        self.neighbors = self.neighbors - self.members
-        self.liberties = {x for x in self.neighbors if not x.is_occupied}
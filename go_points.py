@@ -0,0 +1,23 @@
+# Helpers shared by the Go engines for sets of points held as integer
+# bitmasks, with point (x, y) at bit x * board_size + y.
+
+
+def iter_points(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+def state_id(zhash, repeats, passes, player):
+    """
+    Integer id of a Go state: the 64-bit Zobrist hash of the stones, the
+    points that superko rules out (so states whose legal moves differ get
+    different ids) above it, and the pass flags and side to move below.
+    """
+    flags = (passes[1] << 2) | (passes[-1] << 1) | (player == 1)
+    return (((repeats << 64) | zhash) << 3) | flags
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class HistoryPlanes(object):
+    """
+    The stones of the last few positions as model input planes.
+
+    All the planes live in one preallocated (2 * steps, N, N) int8 array
+    used as a ring: push overwrites the oldest pair (black, white) in
+    place. model_input puts them in order, oldest first, followed by the
+    side-to-move plane, with a single np.take into one output array.
+    """
+
+    _orders = {}
+
+    def __init__(self, board_size, steps=7):
+        self.board_size = board_size
+        self.steps = steps
+        self.planes = np.zeros((2 * steps, board_size, board_size), dtype=np.int8)
+        self.head = 0
+
+        if steps not in HistoryPlanes._orders:
+            HistoryPlanes._orders[steps] = [np.array([2 * ((head + k) % steps) + c for k in range(steps) for c in (0, 1)]) for head in range(steps)]
+        self.orders = HistoryPlanes._orders[steps]
+
+    def copy(self):
+        new = HistoryPlanes.__new__(HistoryPlanes)
+        new.__dict__.update(self.__dict__)
+        new.planes = self.planes.copy()
+        return new
+
+    def push(self, black, white):
+        """ Overwrite the oldest position with these stone planes """
+        self.planes[2 * self.head] = black
+        self.planes[2 * self.head + 1] = white
+        self.head = (self.head + 1) % self.steps
+
+    def stones(self):
+        """ The stone planes, oldest first """
+        return self.planes[self.orders[self.head]]
+
+    def model_input(self, player, out=None):
+        """ The (2 * steps + 1, N, N) model input, written into out when it is given """
+        if out is None:
+            out = np.empty((2 * self.steps + 1, self.board_size, self.board_size), dtype=np.int8)
+        np.take(self.planes, self.orders[self.head], axis=0, out=out[:-1])
+        out[-1] = player
+        return out
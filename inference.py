@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+import config
+
+
+class _Request():
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceServer():
+    """
+    Runs one model for many concurrent searches.
+
+    Each search submits the inputs for its leaves and blocks. A background
+    thread gathers the waiting submissions into one batch, until it holds
+    max_batch positions or timeout seconds have passed since the first one
+    arrived, runs a single model.predict and hands each search its rows.
+    """
+
+    def __init__(self, model, max_batch=config.INFERENCE_BATCH_SIZE, timeout=config.INFERENCE_TIMEOUT):
+        self.model = model
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.requests = queue.Queue()
+        self.thread = None
+
+        self.batches = 0
+        self.positions = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, inputs):
+        request = _Request(inputs)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _gather(self, first):
+        batch = [first]
+        size = len(first.inputs)
+        deadline = time.perf_counter() + self.timeout
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+            size += len(request.inputs)
+        return batch
+
+    def _serve(self):
+        while True:
+            first = self.requests.get()
+            if first is None:
+                return
+            batch = self._gather(first)
+
+            try:
+                preds = self.model.predict(np.concatenate([r.inputs for r in batch]))
+            except Exception as e:
+                # hand the failure to every search waiting on this batch
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            self.batches += 1
+
+            start = 0
+            for request in batch:
+                end = start + len(request.inputs)
+                request.result = [p[start:end] for p in preds]
+                request.done.set()
+                start = end
+            self.positions += start
+
+
+class BatchedModel():
+    """Stands in for a Gen_Model inside an Agent, routing predict through an InferenceServer."""
+
+    def __init__(self, server):
+        self.server = server
+        self.network = server.model
+
+    @property
+    def version(self):
+        return self.network.version
+
+    def predict(self, x):
+        return self.server.submit(x)
+
+    def convertToModelInput(self, state):
+        return self.network.convertToModelInput(state)
+
+    def convertBatchToModelInput(self, states):
+        return self.network.convertBatchToModelInput(states)
@@ -1,4 +1,6 @@
 
+import logging
+
 from utils import setup_logger
 from settings import run_folder
 
@@ -26,4 +28,12 @@ logger_memory.disabled = LOGGER_DISABLED['memory']
 
 logger_model = setup_logger('logger_model', run_folder + 'logs/logger_model.log')
 logger_model.disabled = LOGGER_DISABLED['model']
- 
+
+
+def tracing(logger):
+    """
+    Whether logger would write an info record. The search loops read this
+    once per call and keep their logging under `if trace:`, so a disabled
+    logger costs neither the calls nor their arguments and board renders.
+    """
+    return not logger.disabled and logger.isEnabledFor(logging.INFO)
@@ -9,13 +9,11 @@ import random
 from importlib import reload
 
 
-from keras.utils import plot_model
-
 from game import Game, GameState
 from agent import Agent
 from memory import Memory
-from model import Residual_CNN
-from funcs import playMatches, playMatchesBetweenVersions
+from funcs import playMatchesConcurrently, playMatchesBetweenVersions
+from actors import ActorPool
 
 import loggers as lg
 
@@ -44,23 +42,38 @@ else:
     print('LOADING MEMORY VERSION ' + str(initialise.INITIAL_MEMORY_VERSION) + '...')
     memory = pickle.load( open( run_archive_folder + env.name + '/run' + str(initialise.INITIAL_RUN_NUMBER).zfill(4) + "/memory/memory" + str(initialise.INITIAL_MEMORY_VERSION).zfill(4) + ".p",   "rb" ) )
 
+######## START SELF-PLAY ACTORS IF NECESSARY ########
+
+# the actors are forked, so this has to happen before Keras is imported
+actors = None
+if config.SELF_PLAY_ACTORS > 0:
+    actors = ActorPool(config.SELF_PLAY_ACTORS)
+
+# Keras only after the fork, so that the actors never import TensorFlow
+from keras.utils import plot_model
+from model import Residual_CNN, inference_model
+
 ######## LOAD MODEL IF NECESSARY ########
 
 # create an untrained neural network objects from the config file
 current_NN = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, (15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS)
-best_NN = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, (15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS)
+# the best network is only ever copied into and predicted with, so it is not compiled
+best_NN = inference_model((15,) + env.grid_shape, env.action_size, config.HIDDEN_CNN_LAYERS)
 
 #If loading an existing neural netwrok, set the weights from that model
 if initialise.INITIAL_MODEL_VERSION != None:
     best_player_version  = initialise.INITIAL_MODEL_VERSION
     print('LOADING MODEL VERSION ' + str(initialise.INITIAL_MODEL_VERSION) + '...')
-    m_tmp = best_NN.read(env.name, initialise.INITIAL_RUN_NUMBER, best_player_version)
-    current_NN.model.set_weights(m_tmp.get_weights())
-    best_NN.model.set_weights(m_tmp.get_weights())
+    weights = best_NN.read_weights(env.name, initialise.INITIAL_RUN_NUMBER, best_player_version)
+    current_NN.set_weights(weights)
+    best_NN.set_weights(weights)
 #otherwise just ensure the weights on the two players are the same
 else:
     best_player_version = 0
-    best_NN.model.set_weights(current_NN.model.get_weights())
+    best_NN.set_weights(current_NN.model.get_weights())
+
+if actors is not None:
+    actors.publish(best_NN)
 
 #copy the config file to the run folder
 copyfile('./config.py', run_folder + 'config.py')
@@ -87,7 +100,10 @@ while 1:
 
     ######## SELF PLAY ########
     print('SELF PLAYING ' + str(config.EPISODES) + ' EPISODES...')
-    _, memory, _, _ = playMatches(best_player, best_player, config.EPISODES, lg.logger_main, turns_until_tau0 = config.TURNS_UNTIL_TAU0, memory = memory)
+    if actors is not None:
+        actors.collect(memory, config.EPISODES)
+    else:
+        _, memory, _, _ = playMatchesConcurrently(best_player, best_player, config.EPISODES, lg.logger_main, turns_until_tau0 = config.TURNS_UNTIL_TAU0, memory = memory, games = config.CONCURRENT_GAMES)
     print('\n')
     memory.clear_stmemory()
 
@@ -105,7 +121,9 @@ while 1:
         lg.logger_memory.info('NEW MEMORIES')
         lg.logger_memory.info('====================')
         
+        # rows sent back by the actors carry no state to predict from
         memory_samp = random.sample(memory.ltmemory, min(1000, len(memory.ltmemory)))
+        memory_samp = [s for s in memory_samp if s['state'] is not None]
         
         for s in memory_samp:
             current_value, current_probs, _ = current_player.get_preds(s['state'])
@@ -117,14 +135,20 @@ while 1:
             lg.logger_memory.info('THE MCTS ACTION VALUES: %s', ['%.2f' % elem for elem in s['AV']]  )
             lg.logger_memory.info('CUR PRED ACTION VALUES: %s', ['%.2f' % elem for elem in  current_probs])
             lg.logger_memory.info('BES PRED ACTION VALUES: %s', ['%.2f' % elem for elem in  best_probs])
-            lg.logger_memory.info('ID: %s', s['state'].id)
+            lg.logger_memory.info('ID: %s', s['state'].idString())
             lg.logger_memory.info('INPUT TO MODEL: %s', current_player.model.convertToModelInput(s['state']))
 
             s['state'].render(lg.logger_memory)
             
         ######## TOURNAMENT ########
         print('TOURNAMENT...')
-        scores, _, points, sp_scores = playMatches(best_player, current_player, config.EVAL_EPISODES, lg.logger_tourney, turns_until_tau0 = 0, memory = None)
+        if config.EVAL_SYMMETRIES:
+            best_tourney = Agent('best_player', env.state_size, env.action_size, config.MCTS_SIMS, config.CPUCT, best_NN, symmetries = env.symmetries)
+            current_tourney = Agent('current_player', env.state_size, env.action_size, config.MCTS_SIMS, config.CPUCT, current_NN, symmetries = env.symmetries)
+        else:
+            best_tourney = best_player
+            current_tourney = current_player
+        scores, _, points, sp_scores = playMatchesConcurrently(best_tourney, current_tourney, config.EVAL_EPISODES, lg.logger_tourney, turns_until_tau0 = 0, memory = None, games = config.CONCURRENT_GAMES)
         print('\nSCORES')
         print(scores)
         print('\nSTARTING PLAYER / NON-STARTING PLAYER SCORES')
@@ -135,8 +159,10 @@ while 1:
 
         if scores['current_player'] > scores['best_player'] * config.SCORING_THRESHOLD:
             best_player_version = best_player_version + 1
-            best_NN.model.set_weights(current_NN.model.get_weights())
+            best_NN.set_weights(current_NN.model.get_weights())
             best_NN.write(env.name, best_player_version)
+            if actors is not None:
+                actors.publish(best_NN)
 
     else:
         print('MEMORY SIZE: ' + str(len(memory.ltmemory)))
@@ -17,6 +17,17 @@ class Memory:
                                   'AV': r[1],
                                   'playerTurn': r[0].playerTurn})
 
+    def commit_arrays(self, arrays):
+        """ Store games played elsewhere; these rows carry the model input instead of the state """
+        for i in range(len(arrays['value'])):
+            self.ltmemory.append({'board': None,
+                                  'state': None,
+                                  'input': arrays['input'][i],
+                                  'id': arrays['id'][i],
+                                  'AV': arrays['AV'][i],
+                                  'playerTurn': int(arrays['playerTurn'][i]),
+                                  'value': float(arrays['value'][i])})
+
     def commit_ltmemory(self):
         for i in self.stmemory:
             self.ltmemory.append(i)
@@ -1,6 +1,8 @@
 # %matplotlib inline
 
 import logging
+import os
+
 import config
 import numpy as np
 
@@ -12,10 +14,12 @@ from keras.optimizers import SGD
 from keras import regularizers
 
 from loss import softmax_cross_entropy_with_logits
+from checkpoint import read_weights, write_weights
 
 import loggers as lg
 
 import keras.backend as K
+import tensorflow as tf
 
 from settings import run_folder, run_archive_folder
 
@@ -25,19 +29,41 @@ class Gen_Model():
         self.learning_rate = learning_rate
         self.input_dim = input_dim
         self.output_dim = output_dim
+        # bumped whenever the weights change so that cached predictions can be dropped
+        self.version = 0
 
     def predict(self, x):
-        return self.model.predict(x)
+        # InferenceServer predicts from its own thread, where the TF 1.x default graph is not the model's
+        with self.graph.as_default():
+            return self.model.predict(x)
 
     def fit(self, states, targets, epochs, verbose, validation_split, batch_size):
+        self.version += 1
         return self.model.fit(states, targets, epochs=epochs, verbose=verbose, validation_split = validation_split, batch_size = batch_size)
 
+    def set_weights(self, weights):
+        self.version += 1
+        self.model.set_weights(weights)
+
     def write(self, game, version):
-        self.model.save(run_folder + 'models/version' + "{0:0>4}".format(version) + '.h5')
+        path = run_folder + 'models/version' + "{0:0>4}".format(version)
+        self.model.save(path + '.h5')
+        write_weights(path, self.model.get_weights(), [w.name for w in self.model.weights])
 
     def read(self, game, run_number, version):
         return load_model( run_archive_folder + game + '/run' + str(run_number).zfill(4) + "/models/version" + "{0:0>4}".format(version) + '.h5', custom_objects={'softmax_cross_entropy_with_logits': softmax_cross_entropy_with_logits})
 
+    def read_weights(self, game, run_number, version):
+        """
+        The weights of an archived version, for set_weights on a model that is
+        already built. Reads the weights checkpoint that write saves next to
+        the .h5, falling back to loading the whole .h5 model for older runs.
+        """
+        path = run_archive_folder + game + '/run' + str(run_number).zfill(4) + "/models/version" + "{0:0>4}".format(version)
+        if os.path.exists(path + '.json'):
+            return read_weights(path, [K.int_shape(w) for w in self.model.weights])
+        return self.read(game, run_number, version).get_weights()
+
     def printWeightAverages(self):
         layers = self.model.layers
         for i, l in enumerate(layers):
@@ -105,16 +131,27 @@ class Gen_Model():
         lg.logger_model.info('------------------')
 
 
+def architecture(input_dim, output_dim, hidden_layers):
+    """ A hashable description of a Residual_CNN's layers """
+    return (tuple(input_dim), output_dim, tuple((h['filters'], tuple(h['kernel_size'])) for h in hidden_layers))
+
+
 class Residual_CNN(Gen_Model):
-    def __init__(self, reg_const, learning_rate, input_dim,  output_dim, hidden_layers):
+    # architectures whose summary has been printed in this process
+    _summarised = set()
+
+    def __init__(self, reg_const, learning_rate, input_dim,  output_dim, hidden_layers, compile=True):
         Gen_Model.__init__(self, reg_const, learning_rate, input_dim, output_dim)
         self.hidden_layers = hidden_layers
         self.num_layers = len(hidden_layers)
-        self.model = self._build_model()
+        self.model = self._build_model(compile)
+        # build the predict function now, on this thread, rather than lazily on the first caller's
+        self.model._make_predict_function()
+        self.graph = tf.get_default_graph()
 
-    def residual_layer(self, input_block, filters, kernel_size):
+    def residual_layer(self, input_block, filters, kernel_size, name):
 
-        x = self.conv_layer(input_block, filters, kernel_size)
+        x = self.conv_layer(input_block, filters, kernel_size, name)
 
         x = Conv2D(
         filters = filters
@@ -124,9 +161,10 @@ class Residual_CNN(Gen_Model):
         , use_bias=False
         , activation='linear'
         , kernel_regularizer = regularizers.l2(self.reg_const)
+        , name = 'conv_' + name + '_b'
         )(x)
 
-        x = BatchNormalization(axis=1)(x)
+        x = BatchNormalization(axis=1, name = 'bn_' + name + '_b')(x)
 
         x = add([input_block, x])
 
@@ -134,7 +172,7 @@ class Residual_CNN(Gen_Model):
 
         return (x)
 
-    def conv_layer(self, x, filters, kernel_size):
+    def conv_layer(self, x, filters, kernel_size, name):
 
         x = Conv2D(
         filters = filters
@@ -144,9 +182,10 @@ class Residual_CNN(Gen_Model):
         , use_bias=False
         , activation='linear'
         , kernel_regularizer = regularizers.l2(self.reg_const)
+        , name = 'conv_' + name
         )(x)
 
-        x = BatchNormalization(axis=1)(x)
+        x = BatchNormalization(axis=1, name = 'bn_' + name)(x)
         x = LeakyReLU()(x)
 
         return (x)
@@ -161,10 +200,11 @@ class Residual_CNN(Gen_Model):
         , use_bias=False
         , activation='linear'
         , kernel_regularizer = regularizers.l2(self.reg_const)
+        , name = 'value_conv'
         )(x)
 
 
-        x = BatchNormalization(axis=1)(x)
+        x = BatchNormalization(axis=1, name = 'value_bn')(x)
         x = LeakyReLU()(x)
 
         x = Flatten()(x)
@@ -174,6 +214,7 @@ class Residual_CNN(Gen_Model):
             , use_bias=False
             , activation='linear'
             , kernel_regularizer=regularizers.l2(self.reg_const)
+            , name = 'value_dense'
             )(x)
 
         x = LeakyReLU()(x)
@@ -200,9 +241,10 @@ class Residual_CNN(Gen_Model):
         , use_bias=False
         , activation='linear'
         , kernel_regularizer = regularizers.l2(self.reg_const)
+        , name = 'policy_conv'
         )(x)
 
-        x = BatchNormalization(axis=1)(x)
+        x = BatchNormalization(axis=1, name = 'policy_bn')(x)
         x = LeakyReLU()(x)
 
         x = Flatten()(x)
@@ -217,21 +259,30 @@ class Residual_CNN(Gen_Model):
 
         return (x)
 
-    def _build_model(self):
+    def _build_model(self, compile=True):
 
         main_input = Input(shape = self.input_dim, name = 'main_input')
 
-        x = self.conv_layer(main_input, self.hidden_layers[0]['filters'], self.hidden_layers[0]['kernel_size'])
+        # layer names are what numpy_model.NumpyModel.fromKeras looks the weights up by
+        x = self.conv_layer(main_input, self.hidden_layers[0]['filters'], self.hidden_layers[0]['kernel_size'], '0')
 
         if len(self.hidden_layers) > 1:
-            for h in self.hidden_layers[1:]:
-                x = self.residual_layer(x, h['filters'], h['kernel_size'])
+            for idx, h in enumerate(self.hidden_layers[1:], 1):
+                x = self.residual_layer(x, h['filters'], h['kernel_size'], str(idx))
 
         vh = self.value_head(x)
         ph = self.policy_head(x)
 
         model = Model(inputs=[main_input], outputs=[vh, ph])
-        print(model.summary())
+        arch = architecture(self.input_dim, self.output_dim, self.hidden_layers)
+        if arch not in Residual_CNN._summarised:
+            Residual_CNN._summarised.add(arch)
+            print(model.summary())
+
+        # a model that only predicts needs no loss or optimizer
+        if not compile:
+            return model
+
         model.compile(loss={'value_head': 'mean_squared_error', 'policy_head': softmax_cross_entropy_with_logits},
             optimizer=SGD(lr=self.learning_rate, momentum = config.MOMENTUM),   
             loss_weights={'value_head': 0.5, 'policy_head': 0.5}    
@@ -242,3 +293,34 @@ class Residual_CNN(Gen_Model):
     def convertToModelInput(self, state):
         inputToModel = state.dump_state_example()
         return (inputToModel)
+
+    def convertBatchToModelInput(self, states):
+        inputToModel = np.empty((len(states),) + self.input_dim, dtype=np.int8)
+        for row, state in enumerate(states):
+            state.dump_state_example(out=inputToModel[row])
+        return (inputToModel)
+
+
+_inference_models = {}
+
+
+def inference_model(input_dim, output_dim, hidden_layers, slot=0):
+    """
+    A built, uncompiled Residual_CNN for predicting only.
+
+    Each architecture is built once per process and slot, and later calls
+    get the same instance back, so loading a series of versions into it
+    costs one set_weights each rather than a graph build and a compile.
+    A slot belongs to one caller: slot 0 to the training loop's best
+    network (or, in an actor process, the actor's), slots 1 and 2 to the
+    two players of playMatchesBetweenVersions. Reuse does not touch the
+    weights, which are whatever the slot's owner last set, so a caller that
+    wants the untrained network sets nn.initial_weights itself.
+    """
+    key = (architecture(input_dim, output_dim, hidden_layers), slot)
+    if key not in _inference_models:
+        nn = Residual_CNN(config.REG_CONST, config.LEARNING_RATE, input_dim, output_dim, hidden_layers, compile=False)
+        nn.initial_weights = nn.model.get_weights()
+        _inference_models[key] = nn
+    nn = _inference_models[key]
+    return nn
@@ -0,0 +1,360 @@
+import os
+import random
+
+import numpy as np
+
+
+# keras.layers.LeakyReLU default slope
+LEAKY_ALPHA = 0.3
+
+# inputs, weights and outputs of a real Residual_CNN, written by
+# python benchmark.py parity 1 wherever Keras is installed
+PARITY_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keras_parity.npz')
+
+
+def layout(input_dim, output_dim, hidden_layers):
+    """
+    (name, shape) of every weight of the folded network, in the order that
+    get_weights returns them. Convolutions keep the Keras kernel layout
+    (kh, kw, in, out) and gain a bias, which holds the folded batch norm.
+    """
+    channels, height, width = input_dim
+    area = height * width
+    rv = []
+    for idx, h in enumerate(hidden_layers):
+        names = ['conv_%d' % idx] if idx == 0 else ['conv_%d' % idx, 'conv_%d_b' % idx]
+        for name in names:
+            rv.append((name, tuple(h['kernel_size']) + (channels, h['filters'])))
+            rv.append((name + '_bias', (h['filters'],)))
+            channels = h['filters']
+    rv.append(('value_conv', (1, 1, channels, 1)))
+    rv.append(('value_conv_bias', (1,)))
+    rv.append(('value_dense', (area, 20)))
+    rv.append(('value_head', (20, 1)))
+    rv.append(('policy_conv', (1, 1, channels, 2)))
+    rv.append(('policy_conv_bias', (2,)))
+    rv.append(('policy_head', (2 * area, output_dim)))
+    return rv
+
+
+def foldBatchNorm(kernel, gamma, beta, mean, variance, epsilon):
+    """ The kernel and bias of a bias-free convolution followed by inference-mode batch norm """
+    scale = gamma / np.sqrt(variance + epsilon)
+    return kernel * scale, beta - mean * scale
+
+
+class NumpyModel():
+    """
+    The Residual_CNN forward pass in NumPy, for predicting without TensorFlow.
+
+    Batch norm is folded into the convolutions, which run as one im2col
+    matmul each on channels-last activations. It stands in for a
+    Residual_CNN wherever only predict and the input conversion are used:
+    an Agent, an InferenceServer or a self-play actor.
+    """
+
+    def __init__(self, input_dim, output_dim, hidden_layers, leaky_alpha=LEAKY_ALPHA):
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.hidden_layers = hidden_layers
+        self.leaky_alpha = leaky_alpha
+        self.layout = layout(input_dim, output_dim, hidden_layers)
+        self.layerShapes = dict(self.layout)
+        self.version = 0
+        self.set_weights([np.zeros(shape, dtype=np.float32) for _, shape in self.layout])
+
+    @property
+    def shapes(self):
+        return [shape for _, shape in self.layout]
+
+    def get_weights(self):
+        return [self.weights[name] for name, _ in self.layout]
+
+    def set_weights(self, weights):
+        self.version += 1
+        self.weights = {}
+        for (name, shape), w in zip(self.layout, weights):
+            self.weights[name] = np.asarray(w, dtype=np.float32).reshape(shape)
+        # kernels flattened to (kh * kw * in, out) for the im2col matmul
+        self.matrices = {name: self.weights[name].reshape(-1, shape[-1]) for name, shape in self.layout if len(shape) > 1}
+
+    @property
+    def nbytes(self):
+        return sum(w.nbytes for w in self.weights.values())
+
+    @classmethod
+    def fromKeras(cls, nn):
+        """ Fold a Residual_CNN's weights into a NumpyModel """
+        layers = {layer.name: (layer.get_weights(), getattr(layer, 'epsilon', None)) for layer in nn.model.layers}
+        return cls.fromLayers(nn.input_dim, nn.output_dim, nn.hidden_layers, layers)
+
+    @classmethod
+    def fromLayers(cls, input_dim, output_dim, hidden_layers, layers):
+        """ Fold the weights of a Residual_CNN's layers, {name: (get_weights(), batch norm epsilon)}, into a NumpyModel """
+        weights = []
+        for name, shape in layout(input_dim, output_dim, hidden_layers):
+            if name.endswith('_bias'):
+                continue
+            if len(shape) == 4:
+                bn, epsilon = layers[name.replace('conv', 'bn')]
+                weights.extend(foldBatchNorm(layers[name][0][0], *bn, epsilon=epsilon))
+            else:
+                weights.append(layers[name][0][0])
+        model = cls(input_dim, output_dim, hidden_layers)
+        model.set_weights(weights)
+        return model
+
+    def save(self, path):
+        np.savez(path, input_dim=self.input_dim, output_dim=self.output_dim, leaky_alpha=self.leaky_alpha,
+                 kernel_sizes=[h['kernel_size'] for h in self.hidden_layers], filters=[h['filters'] for h in self.hidden_layers],
+                 **{name: w for (name, _), w in zip(self.layout, self.get_weights())})
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        hidden_layers = [{'filters': int(f), 'kernel_size': tuple(int(k) for k in kernel_size)} for f, kernel_size in zip(data['filters'], data['kernel_sizes'])]
+        model = cls(tuple(int(d) for d in data['input_dim']), int(data['output_dim']), hidden_layers, float(data['leaky_alpha']))
+        model.set_weights([data[name] for name, _ in model.layout])
+        return model
+
+    def leaky(self, x):
+        return np.maximum(x, self.leaky_alpha * x, out=x)
+
+    def conv(self, x, name):
+        """ 'same' convolution of channels-last x, padded the way TensorFlow pads (the odd row and column after) """
+        kh, kw, channels, filters = self.layerShapes[name]
+        batch, height, width, _ = x.shape
+        if kh == kw == 1:
+            cols = x
+        else:
+            top = (kh - 1) // 2
+            left = (kw - 1) // 2
+            padded = np.zeros((batch, height + kh - 1, width + kw - 1, channels), dtype=np.float32)
+            padded[:, top:top + height, left:left + width] = x
+            cols = np.concatenate([padded[:, i:i + height, j:j + width] for i in range(kh) for j in range(kw)], axis=-1)
+        out = self.matmul(cols.reshape(-1, kh * kw * channels), name)
+        out += self.weights[name + '_bias']
+        return out.reshape(batch, height, width, filters)
+
+    def matmul(self, x, name):
+        return np.dot(x, self.matrices[name])
+
+    def flatten(self, x):
+        """ Flatten channels-last x in the channels-first order of the Keras model """
+        return x.transpose(0, 3, 1, 2).reshape(len(x), -1)
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float32).transpose(0, 2, 3, 1)
+
+        x = self.leaky(self.conv(x, 'conv_0'))
+        for idx in range(1, len(self.hidden_layers)):
+            y = self.leaky(self.conv(x, 'conv_%d' % idx))
+            y = self.conv(y, 'conv_%d_b' % idx)
+            y += x
+            x = self.leaky(y)
+
+        v = self.flatten(self.leaky(self.conv(x, 'value_conv')))
+        v = self.leaky(self.matmul(v, 'value_dense'))
+        v = np.tanh(self.matmul(v, 'value_head'))
+
+        p = self.flatten(self.leaky(self.conv(x, 'policy_conv')))
+        p = self.matmul(p, 'policy_head')
+
+        return [v, p]
+
+    def convertToModelInput(self, state):
+        inputToModel = state.dump_state_example()
+        return (inputToModel)
+
+    def convertBatchToModelInput(self, states):
+        inputToModel = np.empty((len(states),) + self.input_dim, dtype=np.int8)
+        for row, state in enumerate(states):
+            state.dump_state_example(out=inputToModel[row])
+        return (inputToModel)
+
+
+class QuantizedModel(NumpyModel):
+    """
+    NumpyModel with post-training quantized weights, for measuring what
+    quantization costs in playing strength.
+
+    'float16' rounds every weight matrix to half precision. 'int8' rounds
+    them to int8 with one scale per output channel, and quantizes each
+    matmul input to int8 too, with one scale per layer that calibrate sets
+    from sample positions; it cannot predict before it is calibrated. The
+    int8 products are summed in float32, which is exact while
+    kh * kw * in * 127 ** 2 stays below 2 ** 24, so the results are those of
+    integer arithmetic. Biases stay in float32.
+
+    NumPy has no int8 or float16 matmul, so the rounded matrices are held
+    as float32, made once per set_weights: the model gives the quantized
+    model's outputs, but takes as much memory as NumpyModel and is no faster
+    (int8, which also rounds every matmul input, is slower).
+    """
+
+    def __init__(self, input_dim, output_dim, hidden_layers, dtype='int8', leaky_alpha=LEAKY_ALPHA):
+        if dtype not in ('int8', 'float16'):
+            raise ValueError('dtype must be int8 or float16, not %r' % (dtype,))
+        self.dtype = dtype
+        self.activationScales = {}
+        self.observed = None
+        NumpyModel.__init__(self, input_dim, output_dim, hidden_layers, leaky_alpha)
+
+    @classmethod
+    def fromModel(cls, model, dtype='int8'):
+        rv = cls(model.input_dim, model.output_dim, model.hidden_layers, dtype, model.leaky_alpha)
+        rv.set_weights(model.get_weights())
+        return rv
+
+    def set_weights(self, weights):
+        NumpyModel.set_weights(self, weights)
+        self.activationScales = {}
+        # what predict multiplies by: the float16 values, or the int8 values before scaling
+        self.scales = {}
+        for name, matrix in self.matrices.items():
+            if self.dtype == 'float16':
+                self.matrices[name] = matrix.astype(np.float16).astype(np.float32)
+                self.scales[name] = None
+            else:
+                scale = np.abs(matrix).max(axis=0) / 127
+                scale[scale == 0] = 1
+                self.matrices[name] = np.rint(matrix / scale).astype(np.float32)
+                self.scales[name] = scale.astype(np.float32)
+        # only the biases are kept at full precision
+        self.weights = {name: w for name, w in self.weights.items() if name.endswith('_bias')}
+
+    def matrix(self, name):
+        """ The dequantized (in, out) weight matrix of a layer """
+        scale = self.scales[name]
+        if scale is None:
+            return self.matrices[name]
+        return self.matrices[name] * scale
+
+    def get_weights(self):
+        rv = []
+        for name, shape in self.layout:
+            rv.append(self.weights[name] if name.endswith('_bias') else self.matrix(name).reshape(shape))
+        return rv
+
+    @property
+    def nbytes(self):
+        return (sum(w.nbytes for w in self.weights.values()) + sum(m.nbytes for m in self.matrices.values())
+                + sum(s.nbytes for s in self.scales.values() if s is not None))
+
+    def matmul(self, x, name):
+        scale = self.scales[name]
+        if scale is None:
+            return np.dot(x, self.matrices[name])
+        if self.observed is not None:
+            self.observed.setdefault(name, []).append(np.abs(x).ravel())
+            out = np.dot(x, self.matrices[name])
+            out *= scale
+            return out
+
+        if name not in self.activationScales:
+            raise RuntimeError('int8 QuantizedModel must be calibrated before it predicts')
+        inputScale = self.activationScales[name]
+        xq = np.rint(x / inputScale)
+        np.clip(xq, -127, 127, out=xq)
+        out = np.dot(xq, self.matrices[name])
+        out *= inputScale * scale
+        return out
+
+    def calibrate(self, x, percentile=99.99):
+        """
+        Fix the int8 input scale of every layer from the activations seen
+        predicting x (model inputs, e.g. from memoryInputs or randomInputs),
+        clipping the largest (100 - percentile)% of values. set_weights
+        clears the scales, so call it again for every new set of weights.
+        """
+        if self.dtype != 'int8':
+            return
+        self.observed = {}
+        try:
+            self.predict(x)
+            self.activationScales = {name: max(float(np.percentile(np.concatenate(values), percentile)), 1e-8) / 127
+                                     for name, values in self.observed.items()}
+        finally:
+            self.observed = None
+
+
+def memoryInputs(ltmemory, model, size=256):
+    """ Model inputs of up to size positions sampled from a replay memory """
+    rows = random.sample(list(ltmemory), min(size, len(ltmemory)))
+    return np.array([row['input'] if row['state'] is None else model.convertToModelInput(row['state']) for row in rows])
+
+
+def randomInputs(env, model, size=256):
+    """ Model inputs of size positions from random games, for calibrating before any self-play """
+    states = []
+    while len(states) < size:
+        state = env.reset()
+        done = 0
+        while not done and len(states) < size:
+            states.append(state)
+            state, _, done, _ = env.step(random.choice(list(state.allowedActions)))
+    return model.convertBatchToModelInput(states)
+
+
+def agreement(reference, candidate, x):
+    """
+    How closely candidate's predictions follow reference's on x: the mean
+    and largest value error, how often the top policy move is the same and
+    the mean total variation distance between the policy softmaxes.
+    """
+    value, logits = reference.predict(x)
+    value_c, logits_c = candidate.predict(x)
+
+    def softmax(logits):
+        odds = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return odds / odds.sum(axis=1, keepdims=True)
+
+    return {'value_mae': float(np.abs(value - value_c).mean()),
+            'value_max': float(np.abs(value - value_c).max()),
+            'policy_top1': float((logits.argmax(axis=1) == logits_c.argmax(axis=1)).mean()),
+            'policy_tv': float(0.5 * np.abs(softmax(logits) - softmax(logits_c)).sum(axis=1).mean())}
+
+
+def writeParityFixture(nn, x, path=PARITY_FIXTURE):
+    """ Save x, the weights of every layer of the Residual_CNN nn and nn.predict(x), for checkParity """
+    value, policy = nn.predict(x)
+    arrays = {'input_dim': nn.input_dim, 'output_dim': nn.output_dim, 'x': x, 'value': value, 'policy': policy,
+              'kernel_sizes': [h['kernel_size'] for h in nn.hidden_layers], 'filters': [h['filters'] for h in nn.hidden_layers]}
+    for layer in nn.model.layers:
+        for idx, w in enumerate(layer.get_weights()):
+            arrays['weights:%s:%d' % (layer.name, idx)] = w
+        if hasattr(layer, 'epsilon'):
+            arrays['epsilon:' + layer.name] = layer.epsilon
+    np.savez(path, **arrays)
+
+
+def checkParity(path=PARITY_FIXTURE, atol=1e-4):
+    """
+    Fold the Residual_CNN weights saved by writeParityFixture into a
+    NumpyModel and check that it predicts the outputs Keras gave for them.
+    Raises ValueError if they differ by more than atol, or if the fixture is
+    missing; returns the largest value and policy errors otherwise.
+    """
+    if not os.path.exists(path):
+        raise ValueError('%s is missing: run python benchmark.py parity 1 where Keras is installed before using NumpyModel' % path)
+    data = np.load(path)
+    layers = {}
+    for key in sorted(data.files):
+        if key.startswith('weights:'):
+            _, name, idx = key.split(':')
+            layers.setdefault(name, ([], None))[0].append((int(idx), data[key]))
+    layers = {name: ([w for _, w in sorted(weights)], float(data['epsilon:' + name]) if 'epsilon:' + name in data.files else None)
+              for name, (weights, _) in layers.items()}
+    hidden_layers = [{'filters': int(f), 'kernel_size': tuple(int(k) for k in kernel_size)} for f, kernel_size in zip(data['filters'], data['kernel_sizes'])]
+    model = NumpyModel.fromLayers(tuple(int(d) for d in data['input_dim']), int(data['output_dim']), hidden_layers, layers)
+
+    value, policy = model.predict(data['x'])
+    errors = (float(np.abs(value - data['value']).max()), float(np.abs(policy - data['policy']).max()))
+    if max(errors) > atol:
+        raise ValueError('NumpyModel differs from Keras on %s: max abs error value %.1e, policy %.1e' % ((path,) + errors))
+    return errors
+
+
+def export(nn, path):
+    """ Write a Residual_CNN as a frozen NumpyModel file that NumpyModel.load reads back """
+    NumpyModel.fromKeras(nn).save(path)
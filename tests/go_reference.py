@@ -0,0 +1,143 @@
+"""
+The implementations the Go engine replaced, kept as references for
+tests/test_go_engines.py and for the timings in benchmark.py.
+"""
+
+
+def full_scan_legal(board, player, superko=True):
+    """
+    player's legal points on board, found by imagining a stone on every
+    empty point, as Board did before it kept board.legal up to date. With
+    superko False, moves that repeat an earlier position count as legal,
+    as they do in board.legal.
+    """
+    legal = []
+    for row in board.positions:
+        for pos in row:
+            if pos.is_occupied:
+                continue
+            rv = board.imagine_position(pos, player)
+            if rv['suicide'] or (superko and rv['repeat']):
+                continue
+            legal.append(pos.x * board.board_size + pos.y)
+    return legal
+
+
+class Dragon(object):
+    """ A region of empty points, built by DragonScorer """
+
+    def __init__(self, identifier, scorer):
+        self.identifier = identifier
+        self.player = 0
+        self.scorer = scorer
+        self.members = set()
+        self.neighbors = set()
+
+    def add_member(self, pos, force=False):
+        if self.player and self.player != pos.player:
+            raise NotImplementedError('Wrong player to connect to this dragon.')
+
+        if not force and self.members and not (pos in self.neighbors or pos in self.members):
+            raise NotImplementedError('Cannot connect to this dragon.')
+
+        if not self.player:
+            self.player = pos.player
+        self.scorer.owner[pos] = self.identifier
+        self.members.add(pos)
+        self.neighbors.update(set([self.scorer.board.pos_by_location(x) for x in pos.neighbors_locs]))
+        self.neighbors = self.neighbors - self.members
+
+
+class DragonScorer(object):
+    """
+    The scorer Board used before territory(): group the empty points into
+    Dragons and split them by bordering colour. It keeps its Dragons to
+    itself, so the board is left as it was.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.dragons = {}
+        # the Dragon each empty Position belongs to
+        self.owner = {}
+
+    @property
+    def next_dragon(self):
+        if not self.dragons:
+            return 1
+        return max(self.dragons.keys()) + 1
+
+    def create_new_dragon(self):
+        dragon_id = self.next_dragon
+        self.dragons[dragon_id] = Dragon(dragon_id, self)
+        return dragon_id
+
+    def stitch_dragons(self, d1_id, d2_id):
+        """ Stitch two dragons into the first one """
+        d1 = self.dragons[d1_id]
+        d2 = self.dragons[d2_id]
+
+        if not d1.neighbors.intersection(d2.members):
+            raise NotImplementedError('Cannot merge unconnected dragons.')
+        for member in d2.members:
+            d1.add_member(member, force=True)
+        del self.dragons[d2_id]
+        return d1
+
+    def get_neighboring_dragons(self, pos, player):
+        neighbors = [self.board.pos_by_location(x) for x in pos.neighbors_locs]
+        rv = set()
+        for x in neighbors:
+            if x in self.owner and x.player == player:
+                rv.add(self.dragons[self.owner[x]])
+        return rv
+
+    def set_empty_dragons(self):
+        """ {1: black's Dragons, -1: white's Dragons, 'all_dragons': every Dragon id} """
+        board = self.board
+        rv = {'all_dragons': set(),
+              1: set(),
+              -1: set()}
+        empty = []
+        for x in range(board.board_size):
+            for y in range(board.board_size):
+                if not board.positions[x][y].is_occupied:
+                    empty.append(board.positions[x][y])
+        for pos1 in empty:
+            if pos1 not in self.owner:
+                n_dragons = list(self.get_neighboring_dragons(pos1, 0))
+                if n_dragons:
+                    d1 = n_dragons[0]
+                    d1.add_member(pos1)
+                    rv['all_dragons'].add(d1.identifier)
+                    for d in n_dragons[1:]:
+                        other_id = d.identifier
+                        self.stitch_dragons(d1.identifier, other_id)
+                        rv['all_dragons'].discard(other_id)
+                    dragon = d1
+                else:
+                    dragon_id = self.create_new_dragon()
+                    dragon = self.dragons[dragon_id]
+                    rv['all_dragons'].add(dragon.identifier)
+                    dragon.add_member(pos1)
+            else:
+                dragon = self.dragons[self.owner[pos1]]
+            for pos2 in empty:
+                if pos1 == pos2:
+                    continue
+                if pos2 in dragon.neighbors:
+                    dragon.add_member(pos2)
+
+        for d_id in rv['all_dragons']:
+            d = self.dragons[d_id]
+            surr_color = set()
+            for x in d.neighbors:
+                surr_color.add(x.player)
+            if len(surr_color) == 1:
+                rv[list(surr_color)[0]].add(d)
+        return rv
+
+    def territory(self):
+        """ Empty points in Dragons bordered by only one colour, per player """
+        rv = self.set_empty_dragons()
+        return {player: sum(len(d.members) for d in rv[player]) for player in (1, -1)}
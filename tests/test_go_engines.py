@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from go_bitboard import BitBoard
+from go_board import Board
+from go_reference import DragonScorer, full_scan_legal
+
+
+def random_games(board_size, games, seed=0):
+    """ The positions of random games on board_size, the same for every run """
+    rng = random.Random(seed)
+    for _ in range(games):
+        board = Board(board_size, playerTurn=1)
+        done = 0
+        while not done:
+            yield board
+            board, _, done = board.takeAction(rng.choice(sorted(board.allowedActions)))
+
+
+@pytest.mark.parametrize('board_size, games', [(5, 3), (9, 1)])
+def test_bitboard_matches_board(board_size, games):
+    """
+    Every child of every position must have the same id, legal moves
+    (through idString), model input, done flag and Zobrist hash on both
+    engines, the incremental hash must match a full rehash, and terminal
+    children must have the same value and score.
+    """
+    rng = random.Random(0)
+    terminal = 0
+    for _ in range(games):
+        reference = Board(board_size, playerTurn=1)
+        board = BitBoard(board_size, playerTurn=1)
+        done = 0
+        while not done:
+            assert reference.id == board.id
+            assert (reference.dump_state_example() == board.dump_state_example()).all()
+
+            expected = [reference.takeAction(a) for a in reference.allowedActions]
+            children = [board.takeAction(a) for a in board.allowedActions]
+            assert len(expected) == len(children)
+            for (s1, v1, d1), (s2, v2, d2) in zip(expected, children):
+                assert (s1.id, d1, s1.playerTurn, s1.zhash) == (s2.id, d2, s2.playerTurn, s2.zhash)
+                assert s1.idString() == s2.idString()
+                assert s1.zhash == s1.zobrist.get_hash(s1.positions, fake=False)
+                assert (s1.dump_state_example() == s2.dump_state_example()).all()
+                if d1:
+                    assert (v1, s1.score) == (v2, s2.score)
+                    terminal += 1
+
+            action = rng.choice(sorted(board.allowedActions))
+            reference, _, _ = reference.takeAction(action)
+            board, _, done = board.takeAction(action)
+    assert terminal
+
+
+@pytest.mark.parametrize('board_size, games', [(5, 20), (9, 10)])
+def test_incremental_legality_matches_full_scan(board_size, games):
+    """
+    The legal moves Board keeps up to date from the points around each move
+    must be the ones a scan of every empty point finds, for the side to move
+    with superko and for both players without it.
+    """
+    for board in random_games(board_size, games):
+        assert list(board.allowedActions) == full_scan_legal(board, board.playerTurn) + [board.PASS_INDEX]
+        for player in (1, -1):
+            assert sorted(board.legal[player]) == full_scan_legal(board, player, superko=False)
+
+
+@pytest.mark.parametrize('board_size, games', [(5, 20), (9, 10)])
+def test_territory_matches_dragon_scorer(board_size, games):
+    """ Board.territory must count the same points as the Dragon scorer it replaced """
+    for board in random_games(board_size, games):
+        assert board.territory() == DragonScorer(board).territory(), board.to_ascii()
@@ -1,13 +1,32 @@
 '''
 adpated from TictactoeZobrist by https://github.com/blackicetee
 '''
+import random
 from random import SystemRandom
 
+import config
+
 
 class Zobrist:
-    def __init__(self, board_size):
-        secure_random = SystemRandom()
-        self.zArray = [[secure_random.randrange(1000000000), secure_random.randrange(1000000000)] for i in range(board_size ** 2)]
+    _shared = {}
+
+    def __init__(self, board_size, seed=None):
+        if seed is None:
+            rng = SystemRandom()
+        else:
+            rng = random.Random(seed)
+        self.zArray = [[rng.getrandbits(64), rng.getrandbits(64)] for i in range(board_size ** 2)]
+
+    @classmethod
+    def shared(cls, board_size):
+        """ The process-wide table for board_size, built from config.ZOBRIST_SEED """
+        if board_size not in cls._shared:
+            cls._shared[board_size] = Zobrist(board_size, seed=config.ZOBRIST_SEED)
+        return cls._shared[board_size]
+
+    def key(self, point, player):
+        """ The key to XOR in or out for player's stone at flat index point """
+        return self.zArray[point][0 if player == 1 else 1]
 
     def get_zobrist_board_position_array(self):
         return self.zArray